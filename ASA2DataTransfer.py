@@ -1,49 +1,52 @@
 import sys
 import os
-import urllib3
-import pandas as pd
-import requests
-import json
 import time
-import csv
+import logging
+import threading
+import multiprocessing
 from PyQt5.QtGui import QIcon, QMovie
-from PyQt5.QtCore import Qt, QTimer, QSize
-from datetime import datetime
+from PyQt5.QtCore import Qt, QTimer, QSize, pyqtSignal
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QFileDialog, QLabel, 
     QVBoxLayout, QHBoxLayout, QWidget, QTableWidgetItem, QMessageBox, 
-    QAction, QDialog, QListWidget, QTextEdit
+    QAction, QDialog, QListWidget, QTextEdit, QTableWidget, QHeaderView, QComboBox, QLineEdit
 )
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from log_index import LEVEL_NAMES, LogIndex
+from transfer_engine import TransferEngine, load_config
+from transfer_logging import list_log_files
+
+# Optional settings file, in the same format as the headless daemon's --config
+CONFIG_PATH = "config.json"
+
 
 class DirectoryBrowser(QMainWindow):
+    # Emitted from worker threads, delivered to the GUI thread by Qt
+    status_message = pyqtSignal(str)
+    latest_file_message = pyqtSignal(str)
+    network_status_changed = pyqtSignal(bool)
+
     def __init__(self, version):
         super().__init__()
         self.init_main_layout(version)
     
     def init_main_layout(self, version):
         self.version = version  
-        self.log_dir = "logs"
-        self.ensure_log_directory() 
         self.setWindowTitle(f"Data Transfer - v{self.version}")
         self.setGeometry(200, 200, 700, 200)
         # self.setStyleSheet("background-color: lightblue;")
 
-        self.version = version
-        self.log_dir = "logs"  
-        self.ensure_log_directory()
-
-        self.latest_csv_file = None
-        self.latest_json_data = None
-        self.previous_csv_file = None
-        self.err_msg = None
-
-        self.current_log_file = self.generate_log_filename()
-        self.generate_log_file() 
+        # The window is only a front-end: scanning, parsing and sending run in the engine
+        self.config = load_config(CONFIG_PATH if os.path.exists(CONFIG_PATH) else None)
+        self.engine = TransferEngine(self.config,
+                                     on_status=self.status_message.emit,
+                                     on_latest_file=self.latest_file_message.emit,
+                                     on_network_status=self.network_status_changed.emit)
+        self.log_dir = self.engine.log_dir
 
         self.log_timer = QTimer(self)
         self.log_timer.setInterval(60 * 1000)  # 1 minute (60,000 milliseconds)
+        self.log_timer.timeout.connect(self.engine.enforce_log_retention)  # runs every log_retention_interval
         self.log_timer.start()
 
         icon_path = "images/your-logo.png"
@@ -151,7 +154,11 @@ class DirectoryBrowser(QMainWindow):
         self.network_status_label.setStyleSheet("color: red;")
         bottom_layout.addWidget(self.network_status_label) 
 
-        self.check_network_connection()
+        self.status_message.connect(self.msg_label.setText)
+        self.latest_file_message.connect(self.latestfile_label.setText)
+        self.network_status_changed.connect(self.update_network_status)
+
+        self.start_network_check()
 
         bottom_layout.addWidget(QLabel(f"Your Team", self), alignment=Qt.AlignRight)
         bottom_layout.itemAt(bottom_layout.count() - 1).widget().setStyleSheet("color: gray;")
@@ -162,14 +169,15 @@ class DirectoryBrowser(QMainWindow):
         self.setCentralWidget(self.central_widget)
 
         self.timer = QTimer(self)
-        self.timer.setInterval(1000)  # Set the timer interval to 1 hour (3600000 ms)
+        self.timer.setInterval(int(self.config["poll_interval"] * 1000))
         self.timer.timeout.connect(self.timer_timeout)
 
         self.selected_directory = None
+        self.stats_dialog = None
 
         self.heartbeat_timer = QTimer(self)
-        self.heartbeat_timer.setInterval(5000) 
-        self.heartbeat_timer.timeout.connect(self.check_network_connection)
+        self.heartbeat_timer.setInterval(int(self.config["network_check_interval"] * 1000))
+        self.heartbeat_timer.timeout.connect(self.start_network_check)
         self.heartbeat_timer.start()   
 
         # Set up the GIF using QMovie
@@ -197,6 +205,16 @@ class DirectoryBrowser(QMainWindow):
             view_logs_action.triggered.connect(self.view_logs)
             logs_menu.addAction(view_logs_action)
 
+            tools_menu = menu_bar.addMenu("Tools")
+
+            stats_action = QAction("Statistics", self)
+            stats_action.triggered.connect(self.view_stats)
+            tools_menu.addAction(stats_action)
+
+            profile_action = QAction("Profile Next File", self)
+            profile_action.triggered.connect(self.profile_next_file)
+            tools_menu.addAction(profile_action)
+
             help_menu = menu_bar.addMenu("Help")
 
             about_action = QAction("About", self)
@@ -207,21 +225,21 @@ class DirectoryBrowser(QMainWindow):
         self.show_gif()
         self.start_data_extraction()
 
-    def check_network_connection(self):
-        srv_url = "https://your_rest_api_url" # RestApi
-        try:
-            response = requests.get(srv_url, timeout=3, verify=False)
-            if response.status_code == 200:
-                self.network_status_label.setText("Network Status: Connected")
-                self.network_status_label.setStyleSheet("color: green;")
-            else:
-                self.network_status_label.setText("Network Status: Disconnected")
-                self.network_status_label.setStyleSheet("color: red;")
-                self.write_to_log("Network Status: Disconnected")
-        except requests.RequestException:
+    def start_network_check(self):
+        # Probes only when due; the label is refreshed from the cached status
+        self.engine.check_network()
+        if self.engine.connected is not None:
+            self.update_network_status(self.engine.connected)
+
+    def update_network_status(self, connected):
+        if connected:
+            rates = self.engine.rate_status() if self.engine.running else ""
+            self.network_status_label.setText(f"Network Status: Connected ({rates})" if rates
+                                              else "Network Status: Connected")
+            self.network_status_label.setStyleSheet("color: green;")
+        else:
             self.network_status_label.setText("Network Status: Disconnected")
             self.network_status_label.setStyleSheet("color: red;")
-            self.write_to_log("Network Status: Disconnected")
 
     def update_button_states(self):
         if self.log_dir:
@@ -243,150 +261,21 @@ class DirectoryBrowser(QMainWindow):
 
         self.update_button_states()
 
-    def load_latest_csv(self, directory):
-        csv_files = [f for f in os.listdir(directory) if f.endswith('.csv')]
-
-        if csv_files:
-            latest_file = max(csv_files, key=lambda f: os.path.getmtime(os.path.join(directory, f)))
-            latest_file_path = os.path.join(directory, latest_file)
-
-            # Check if the latest file is different from the previous one
-            if latest_file_path != self.previous_csv_file:
-                self.previous_csv_file = latest_file_path
-                self.latest_csv_file = latest_file_path
-                self.latestfile_label.setText(f"Latest CSV File: {latest_file}")
-                self.write_to_log(f"Latest CSV File: {latest_file}")
-
-                self.load_csv(latest_file_path)
-            else:
-                self.latestfile_label.setText("No new CSV file found.")
-        else:
-            self.latestfile_label.setText("No CSV files found.")
-            # self.write_to_log("No CSV files found.")
-
-    def load_csv(self, file_path):
-        error_msg = ""  # Initialize error_msg to avoid UnboundLocalError
-
-        try:
-            processed_rows = []
-            with open(file_path, mode='r', newline='', encoding='utf-8') as file:
-                csv_reader = csv.reader(file)
-
-                # Read header
-                header = next(csv_reader, None)
-                if header is None:
-                    raise ValueError("CSV file is empty or has no header.")
-
-                for row in csv_reader:
-                    row = row[:8]  # Limit to 8 columns
-                    row = [cell.strip().replace('\x00', '') for cell in row]
-
-                    if not any(row):  # Skip completely empty rows
-                        continue
-
-                    processed_rows.append(row)
-
-            # Debugging: Print length of processed rows
-            if not processed_rows:
-                raise ValueError("No valid data found in the CSV file.")
-
-            # Create DataFrame
-            df = pd.DataFrame(processed_rows)
-
-            # Debugging: Print DataFrame info
-            # print("DataFrame Info:")
-            # print(df.info())
-            # print(df.head())
-
-            # Ensure DataFrame has 8 columns before renaming
-            if df.shape[1] != 8:
-                raise ValueError(f"Expected 8 columns, but got {df.shape[1]}.")
-
-            # Rename columns
-            df.columns = ["Col1", "Col2", "Col3", "Col4", "Col5", "Col6", "Col7", "Col8"]
-
-            # Send data to API (Ensure this function is defined)
-            self.send_data_to_api(df)
-
-        except FileNotFoundError:
-            error_msg = f"File not found: {file_path}"
-        except ValueError as ve:
-            error_msg = f"Value error: {ve}"
-        except Exception as e:
-            error_msg = f"Error reading CSV file: {e}"
-        finally:
-            if error_msg:  # Only display if there's an error
-                self.msg_label.setText(error_msg)
-                self.write_to_log(error_msg)
-
-    def send_data_to_api(self, df):
-
-        api_url = "https://your_rest_api_url"  # RestApi for to post the csv data
-        headers = {
-            "Content-Type": "application/json"
-        }
-
-        # Customize the json item names
-        column_name_mapping   = {
-            'column_1': 'column_1',
-            'column_2': 'column_2',
-            'column_3': 'column_3',
-            'column_4': 'column_4',
-            'column_5': 'column_5',
-            'column_6': 'column_6',
-            'column_7': 'column_7',
-            'column_8': 'column_8'
-        }
-
-        try:
-            df.columns = list(column_name_mapping.values())
-            # df = df.rename(columns=column_name_mapping)
-        except Exception as e:
-            raise ValueError(f"Error renaming DataFrame columns: {e}")
-        
-        if 'column_7' in df.columns:
-            df['column_7'] = df['column_7'].astype(str)
-
-        self.latest_json_data = df.to_json(orient='records')
-
-        self.latest_json_data = self.prettify_json(self.latest_json_data)
-        try:
-            response = requests.post(api_url, data=self.latest_json_data, headers=headers, verify=False)
-            response.raise_for_status() 
-            
-            self.msg_label.setText(f"Api Response: {response.text}")
-            self.write_to_log(f"{response.text}")
-            # self.latestfile_label.setText(f"API Response: {response.text}")
-            # self.generate_log_file()
-
-        except requests.exceptions.RequestException as e:
-            print(f"Error sending data to API: {e}")
-            raise
-
-    def display_csv(self, df):
+    def display_csv(self, rows):
         custom_column_names = ['C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'C7', 'C8']
-        
-        df.columns = custom_column_names
 
-        self.table.setRowCount(df.shape[0])
-        self.table.setColumnCount(df.shape[1])
+        self.table.setRowCount(len(rows))
+        self.table.setColumnCount(len(custom_column_names))
 
-        self.table.setHorizontalHeaderLabels(df.columns)
+        self.table.setHorizontalHeaderLabels(custom_column_names)
 
-        for row in range(df.shape[0]):
-            for col in range(df.shape[1]):
-                self.table.setItem(row, col, QTableWidgetItem(str(df.iat[row, col])))
-
-    def prettify_json(self, json_data):
-        try:
-            parsed_json = json.loads(json_data)
-            return json.dumps(parsed_json, indent=4)  
-        except json.JSONDecodeError as e:
-            print(f"Error pretty-printing JSON: {e}")
-            return json_data  
+        for row, values in enumerate(rows):
+            for col, value in enumerate(values[:len(custom_column_names)]):
+                self.table.setItem(row, col, QTableWidgetItem(str(value)))
 
     def start_data_extraction(self):
         if self.selected_directory: 
+            self.engine.start(self.selected_directory)
             self.timer.start()
             self.browse_button.setEnabled(False)
             self.start_button.setEnabled(False)
@@ -396,32 +285,44 @@ class DirectoryBrowser(QMainWindow):
 
     def timer_timeout(self):
         if self.selected_directory: 
-            self.load_latest_csv(self.selected_directory)
+            self.engine.tick()
 
     def stop_data_extraction(self):
         self.stop_gif() 
         self.timer.stop()
+        self.engine.stop()
         self.msg_label.setText("Data transfer stopped")
         self.browse_button.setEnabled(True)
         self.start_button.setEnabled(True)
 
     def view_logs(self):
         try:
-            log_files = [f for f in os.listdir(self.log_dir) if f.endswith(".txt")]
+            log_files = list_log_files(self.log_dir)  # newest first
             if log_files:
-
-                log_files = sorted(
-                    log_files,
-                    key=lambda f: os.path.getmtime(os.path.join(self.log_dir, f)),
-                    reverse=True
-                )
                 dialog = LogViewerDialog(log_dir=self.log_dir, log_files=log_files)
                 dialog.exec_()
             else:
                 QMessageBox.information(self, "View Logs", "No log files found in the logs directory.")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"An error occurred while loading logs: {e}")
-            self.write_to_log(f"An error occurred while loading logs: {e}")
+            self.write_to_log(f"An error occurred while loading logs: {e}", logging.ERROR)
+
+    def view_stats(self):
+        # Non-modal, so it can stay open while files are sent
+        if self.stats_dialog is None:
+            self.stats_dialog = StatsDialog(self.engine.metrics, self)
+        self.stats_dialog.show()
+        self.stats_dialog.raise_()
+
+    def profile_next_file(self):
+        self.engine.profile_next_file()
+        self.msg_label.setText("The next file will be profiled")
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        self.heartbeat_timer.stop()
+        self.engine.close(wait=False)
+        super().closeEvent(event)
 
     def show_about(self):
         QMessageBox.information(self, "About", "Data Transfer\n"
@@ -439,87 +340,33 @@ class DirectoryBrowser(QMainWindow):
     def stop_gif(self):
         self.movie.stop()  
 
-    def ensure_log_directory(self):
-        if not os.path.exists(self.log_dir):
-            os.makedirs(self.log_dir)
-
-    def generate_log_filename(self):
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H")
-        return os.path.join(self.log_dir, f"latest_csv_log_{timestamp}.txt")
-
-    def generate_log_file(self):
-        self.current_log_file = self.generate_log_filename()
-
-        try:
-            with open(self.current_log_file, "a") as log_file:
-                log_entry = f"Log generated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                log_file.write(log_entry)
-
-                if self.latest_csv_file:
-                    log_file.write(f"Latest CSV File: {self.latest_csv_file}\n")
-
-                if self.latest_json_data:
-                    self.latest_json_data = self.prettify_json(self.latest_json_data)
-                    log_file.write(f"JSON Data:\n{self.latest_json_data}\n")
-                    
-                log_file.write("=" * 50 + "\n")
-
-        except IOError as e:
-            print(f"Error writing to log file: {e}")
-            self.write_to_log(f"Error writing to log file: {e}")
-
-        # Clean up old log files
-        self.cleanup_old_files(self.log_dir)
-
-    def write_to_log(self, message):
-        if not hasattr(self, 'current_log_file') or not self.current_log_file:
-            self.current_log_file = self.generate_log_filename()
-            self.generate_log_file()  # Create the log file if it doesn't exist
-
-        try:
-            with open(self.current_log_file, "a") as log_file:
-                log_file.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}\n")
-        except IOError as e:
-            print(f"Failed to write to log: {e}")
+    def write_to_log(self, message, level=logging.INFO):
+        self.engine.write_to_log(message, level)
 
     def log_latest_csv(self, latest_file):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"{timestamp} - {latest_file}\n"
-        
-        try:
-            with open(self.log_file_path, "a") as log_file:
-                log_file.write(log_entry)
-            print(f"Logged: {log_entry.strip()}")
-        except IOError as e:
-            print(f"Error writing to log file: {e}")
-
-    def cleanup_old_files(self, directory):
-        one_week_ago = time.time() - (7 * 24 * 60 * 60)  # Current time minus 7 days in seconds
-
-        for file_name in os.listdir(directory):
-            file_path = os.path.join(directory, file_name)
-
-            # Ensure we're only looking at files (not directories)
-            if os.path.isfile(file_path):
-                file_mod_time = os.path.getmtime(file_path)
-
-                if file_mod_time < one_week_ago:
-                    try:
-                        os.remove(file_path)
-                        # Optional: Log deletion
-                        with open("cleanup_log.txt", "a") as log_file:
-                            log_file.write(f"{time.ctime()}: Deleted {file_name}\n")
-                    except Exception as e:
-                        print(f"Error deleting file {file_name}: {e}")
-                        self.write_to_log(f"Error deleting file {file_name}: {e}")
+        self.write_to_log(latest_file)
+        print(f"Logged: {latest_file}")
 
 class LogViewerDialog(QDialog):
+    # Index and filter results come back from a worker thread
+    results_ready = pyqtSignal(int, object)
+    PAGE_SIZE = 200  # records shown at a time
+
     def __init__(self, log_dir, log_files):
         super().__init__()
 
         self.log_dir = log_dir
         self.setWindowTitle("View Logs")
-        self.setGeometry(300, 200, 600, 400)
+        self.setGeometry(300, 200, 800, 600)
+
+        # Large log files are indexed once, then read a page at a time
+        self.index = None
+        self.index_lock = threading.Lock()
+        self.matches = []
+        self.page = 0
+        self.request = 0  # results of an older request are ignored
+        self.stop_event = threading.Event()
+        self.results_ready.connect(self.show_results)
 
         layout = QVBoxLayout()
 
@@ -527,32 +374,215 @@ class LogViewerDialog(QDialog):
         self.log_list = QListWidget(self)
         self.log_list.addItems(log_files)
         self.log_list.itemClicked.connect(self.load_log_content)
+        self.log_list.setMaximumHeight(120)
         layout.addWidget(self.log_list)
 
+        filter_layout = QHBoxLayout()
+        self.level_box = QComboBox(self)
+        self.level_box.addItem("All levels", None)
+        self.level_box.addItem("Warnings and errors", LEVEL_NAMES["WARNING"])
+        self.level_box.addItem("Errors", LEVEL_NAMES["ERROR"])
+        filter_layout.addWidget(self.level_box)
+
+        self.text_edit = QLineEdit(self)
+        self.text_edit.setPlaceholderText("CSV file name or text")
+        filter_layout.addWidget(self.text_edit)
+
+        self.start_edit = QLineEdit(self)
+        self.start_edit.setPlaceholderText("From (YYYY-mm-dd HH:MM)")
+        filter_layout.addWidget(self.start_edit)
+
+        self.end_edit = QLineEdit(self)
+        self.end_edit.setPlaceholderText("To (YYYY-mm-dd HH:MM)")
+        filter_layout.addWidget(self.end_edit)
+
+        filter_button = QPushButton("Filter", self)
+        filter_button.clicked.connect(self.apply_filter)
+        for edit in (self.text_edit, self.start_edit, self.end_edit):
+            edit.returnPressed.connect(self.apply_filter)
+        filter_layout.addWidget(filter_button)
+        layout.addLayout(filter_layout)
+
         # Log content display
         self.log_content = QTextEdit(self)
         self.log_content.setReadOnly(True)
         layout.addWidget(self.log_content)
 
+        page_layout = QHBoxLayout()
+        self.previous_button = QPushButton("< Previous", self)
+        self.previous_button.clicked.connect(lambda: self.show_page(self.page - 1))
+        page_layout.addWidget(self.previous_button)
+
+        self.page_label = QLabel("", self)
+        self.page_label.setAlignment(Qt.AlignCenter)
+        page_layout.addWidget(self.page_label)
+
+        self.next_button = QPushButton("Next >", self)
+        self.next_button.clicked.connect(lambda: self.show_page(self.page + 1))
+        page_layout.addWidget(self.next_button)
+
+        # The latest log file is still being written; Refresh indexes what was added
+        refresh_button = QPushButton("Refresh", self)
+        refresh_button.clicked.connect(self.apply_filter)
+        page_layout.addWidget(refresh_button)
+
         # Close button
         close_button = QPushButton("Close", self)
         close_button.clicked.connect(self.close)
-        layout.addWidget(close_button)
+        page_layout.addWidget(close_button)
+        layout.addLayout(page_layout)
 
         self.setLayout(layout)
+        self.update_page_buttons()
 
     def load_log_content(self, item):
-        """Load and display the content of the selected log file."""
-        selected_log_file = item.text()
-        log_file_path = os.path.join(self.log_dir, selected_log_file)
+        """Index the selected log file in the background and show its first page."""
+        self.index = LogIndex(os.path.join(self.log_dir, item.text()))
+        self.apply_filter()
+
+    def apply_filter(self):
+        if self.index is None:
+            return
+        filters = {
+            "min_level": self.level_box.currentData(),
+            "text": self.text_edit.text().strip() or None,
+            "start": self.start_edit.text().strip() or None,
+            "end": self.end_edit.text().strip() or None,
+        }
+
+        # A running request is told to stop; its results would be ignored anyway
+        self.stop_event.set()
+        self.stop_event = threading.Event()
+        self.request += 1
+        request, index, stop_event = self.request, self.index, self.stop_event
+        self.page_label.setText("Loading...")
+
+        def work():
+            try:
+                with self.index_lock:
+                    index.update(stop_event)
+                    result = index.filter(stop=stop_event, **filters)
+            except Exception as e:
+                result = e
+            self.results_ready.emit(request, result)
+
+        threading.Thread(target=work, name="log-index", daemon=True).start()
+
+    def show_results(self, request, result):
+        if request != self.request:
+            return
+        if isinstance(result, Exception):
+            self.page_label.setText("")
+            QMessageBox.critical(self, "Error", f"Unable to load log file: {result}")
+            return
+        self.matches = result
+        self.show_page(0)
+
+    def show_page(self, page):
+        pages = max(1, -(-len(self.matches) // self.PAGE_SIZE))
+        self.page = min(max(page, 0), pages - 1)
+        start = self.page * self.PAGE_SIZE
         try:
-            with open(log_file_path, "r") as file:
-                content = file.read()
-                self.log_content.setText(content)
+            # No lock: a running update only appends to the index
+            records = self.index.read(self.matches[start:start + self.PAGE_SIZE])
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Unable to load log file: {e}")
+            return
+        self.log_content.setPlainText("\n".join(records))
+        if self.matches:
+            self.page_label.setText(f"Records {start + 1:,}-{start + len(records):,} of {len(self.matches):,} "
+                                    f"(page {self.page + 1:,} of {pages:,})")
+        else:
+            self.page_label.setText("No matching records")
+        self.update_page_buttons()
+
+    def update_page_buttons(self):
+        self.previous_button.setEnabled(self.page > 0)
+        self.next_button.setEnabled((self.page + 1) * self.PAGE_SIZE < len(self.matches))
+
+    def closeEvent(self, event):
+        self.stop_event.set()
+        super().closeEvent(event)
+
+class StatsDialog(QDialog):
+    # Stages in pipeline order; "post" is the HTTP request time of each attempt
+    STAGES = ["scan", "read", "convert", "serialize", "compress", "post"]
+
+    def __init__(self, metrics, parent=None):
+        super().__init__(parent)
+
+        self.metrics = metrics
+        self.previous = None
+        self.setWindowTitle("Statistics")
+        self.setGeometry(300, 200, 520, 380)
+
+        layout = QVBoxLayout()
+
+        self.totals_label = QLabel(self)
+        self.totals_label.setStyleSheet("padding-left: 5px; color: darkblue;")
+        layout.addWidget(self.totals_label)
+
+        # Latency of each stage, per batch
+        self.stage_table = QTableWidget(len(self.STAGES), 4, self)
+        self.stage_table.setHorizontalHeaderLabels(["Count", "Mean (ms)", "p50 (ms)", "p95 (ms)"])
+        self.stage_table.setVerticalHeaderLabels(self.STAGES)
+        self.stage_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.stage_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.stage_table)
+
+        close_button = QPushButton("Close", self)
+        close_button.clicked.connect(self.close)
+        layout.addWidget(close_button)
+
+        self.setLayout(layout)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start()
+        self.refresh()
+
+    def refresh(self):
+        now = time.monotonic()
+        current = {name: self.metrics.total(name) for name in (
+            "ingest_rows_total", "ingest_bytes_read_total", "ingest_payload_bytes_total", "ingest_rows_rejected_total")}
+
+        # Rates are taken over the last refresh interval
+        rates = dict.fromkeys(current, 0.0)
+        if self.previous is not None:
+            then, before = self.previous
+            elapsed = max(now - then, 1e-6)
+            rates = {name: (current[name] - before[name]) / elapsed for name in current}
+        self.previous = (now, current)
+
+        self.totals_label.setText(
+            f"Rows/s: {rates['ingest_rows_total']:,.0f}    "
+            f"Read: {rates['ingest_bytes_read_total'] / 1024 / 1024:,.2f} MiB/s    "
+            f"Sent: {rates['ingest_payload_bytes_total'] / 1024 / 1024:,.2f} MiB/s\n"
+            f"Rows: {current['ingest_rows_total']:,}    Rejected: {current['ingest_rows_rejected_total']:,}    "
+            f"Files: {self.metrics.total('ingest_files_total'):,}    "
+            f"Batches: {self.metrics.total('ingest_batches_total'):,}")
+
+        stages = self.metrics.histogram_summary("ingest_stage_seconds", "stage")
+        posts = self.metrics.histogram_summary("http_request_seconds", "method")
+        if "POST" in posts:
+            stages["post"] = posts["POST"]
+        for row, stage in enumerate(self.STAGES):
+            count, mean, p50, p95 = stages.get(stage, (0, 0.0, 0.0, 0.0))
+            values = [f"{count:,}", f"{mean * 1000:.2f}", f"{p50 * 1000:.1f}", f"{p95 * 1000:.1f}"]
+            for column, value in enumerate(values):
+                self.stage_table.setItem(row, column, QTableWidgetItem(value))
+
+    def closeEvent(self, event):
+        self.refresh_timer.stop()
+        super().closeEvent(event)
+
+    def showEvent(self, event):
+        self.refresh_timer.start()
+        super().showEvent(event)
 
 def main():
+    multiprocessing.freeze_support()  # the parse processes of a frozen build start through main()
     app = QApplication(sys.argv)
 
     app.setWindowIcon(QIcon("images/your-logo.png")) 
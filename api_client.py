@@ -0,0 +1,330 @@
+import gzip
+import json
+import importlib.util
+import time
+import random
+import threading
+import urllib3
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+
+# Optional packages: faster JSON, MessagePack payloads and zstd compression
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Destination for the CSV data and how batches are encoded on the wire
+#   format:      "json" (array of records), "ndjson" (one record per line),
+#                "msgpack" (array of records) or "arrow" (columnar Arrow IPC stream, needs pyarrow)
+#   compression: None, "gzip" or "zstd" (needs zstandard), sent as Content-Encoding
+#   rate_limit:  requests per second allowed to the destination, see rate_control
+API_DESTINATION = {
+    "url": "https://your_rest_api_url",
+    "format": "json",
+    "compression": None,
+    "rate_limit": 0,                # most requests per second to this destination (0 = no limit)
+}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# HTTP transport shared by the uploader and the network check
+NETWORK_CHECK_URL = "https://your_rest_api_url"  # probed for the network status when no uploads are answered
+API_TIMEOUT = (5, 60)               # (connect, read) seconds for posting data
+NETWORK_CHECK_TIMEOUT = 3
+HTTP_POOL_CONNECTIONS = 4           # number of hosts kept in the pool
+HTTP_POOL_MAXSIZE = 8               # keep-alive connections per host
+HTTP_MAX_RETRIES = 5
+HTTP_BACKOFF_FACTOR = 0.5           # first retry waits ~0.5 s, then doubles
+HTTP_BACKOFF_MAX = 30
+HTTP_BACKOFF_JITTER = 0.5           # up to +50% random delay so clients do not retry in step
+HTTP_RETRY_AFTER_MAX = 300          # longest Retry-After the server may ask for
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Batch uploads: several batches of a file can be in flight at once
+UPLOAD_MAX_IN_FLIGHT = 4            # keep at or below HTTP_POOL_MAXSIZE
+UPLOAD_PRESERVE_ORDER = False       # True sends a file's batches one at a time, in order
+IDEMPOTENCY_HEADER = "Idempotency-Key"  # carries each batch's key, so the API can drop repeats
+
+
+def dumps_json(data):
+    # Compact UTF-8 JSON bytes, using orjson when it is installed
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def encode_arrow(records):
+    import pyarrow  # imported on first use, it is slow to load
+
+    table = pyarrow.Table.from_pylist(records)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class PayloadEncoder:
+    """Encodes a batch of records in the wire format configured for a destination."""
+
+    CONTENT_TYPES = {
+        "json": "application/json",
+        "ndjson": "application/x-ndjson",
+        "msgpack": "application/msgpack",
+        "arrow": "application/vnd.apache.arrow.stream",
+    }
+
+    def __init__(self, destination):
+        self.format = destination.get("format", "json")
+        self.compression = destination.get("compression")
+
+        # Fail when the destination is set up, not on the first batch
+        if self.format not in self.CONTENT_TYPES:
+            raise ValueError(f"Unsupported payload format: {self.format}")
+        if self.format == "msgpack" and msgpack is None:
+            raise ValueError("The msgpack format needs the msgpack package.")
+        if self.format == "arrow" and importlib.util.find_spec("pyarrow") is None:
+            raise ValueError("The arrow format needs the pyarrow package.")  # imported on first use
+        if self.compression not in (None, "gzip", "zstd"):
+            raise ValueError(f"Unsupported compression: {self.compression}")
+        if self.compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package.")
+
+        self.headers = {"Content-Type": self.CONTENT_TYPES[self.format]}
+        if self.compression:
+            self.headers["Content-Encoding"] = self.compression
+
+    def serialize(self, records):
+        if self.format == "json":
+            return dumps_json(records)
+        if self.format == "ndjson":
+            return b"".join(dumps_json(record) + b"\n" for record in records)
+        if self.format == "msgpack":
+            return msgpack.packb(records, use_bin_type=True)
+        return encode_arrow(records)
+
+    def compress(self, body):
+        if self.compression == "gzip":
+            return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)  # same batch, same bytes
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+        return body
+
+
+class ApiTransport:
+    """Pooled keep-alive HTTP session with timeouts and retry/backoff, shared by all requests."""
+
+    def __init__(self, stop_event=None, timeout=API_TIMEOUT, max_retries=HTTP_MAX_RETRIES,
+                 pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, metrics=None, health=None):
+        self.stop_event = stop_event
+        self.metrics = metrics  # optional metrics.Metrics, timing every attempt
+        self.health = health    # optional health.HealthMonitor, told the outcome of every attempt
+        self.timeout = tuple(timeout) if isinstance(timeout, list) else timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.verify = False
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(self, url, data=None, headers=None, timeout=None, retries=None, on_attempt=None):
+        return self.request("POST", url, data=data, headers=headers,
+                            timeout=self.timeout if timeout is None else timeout,
+                            retries=self.max_retries if retries is None else retries, on_attempt=on_attempt)
+
+    def get(self, url, timeout=NETWORK_CHECK_TIMEOUT, retries=0, **kwargs):
+        return self.request("GET", url, timeout=timeout, retries=retries, **kwargs)
+
+    def request(self, method, url, timeout=API_TIMEOUT, retries=HTTP_MAX_RETRIES, on_attempt=None, **kwargs):
+        # on_attempt(seconds, status_code, retry_after) is called after every attempt;
+        # status_code is None when no response came back
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.record(method, started, type(e).__name__)
+                if on_attempt is not None:
+                    on_attempt(time.perf_counter() - started, None, None)
+                if attempt >= retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+            else:
+                self.record(method, started, response.status_code)
+                retryable = response.status_code in HTTP_RETRY_STATUSES
+                delay = self.retry_after(response) if retryable else None
+                if on_attempt is not None:
+                    on_attempt(time.perf_counter() - started, response.status_code, delay)
+                if not retryable or attempt >= retries:
+                    return response
+                if delay is None:
+                    delay = self.backoff_delay(attempt)
+                response.close()
+
+            attempt += 1
+            if self.stop_event is None:
+                time.sleep(delay)
+            elif self.stop_event.wait(delay):
+                raise InterruptedError("Data transfer stopped while waiting to retry.")
+
+    def record(self, method, started, outcome):
+        if self.health is not None:
+            self.health.observe(outcome)
+        if self.metrics is not None:
+            self.metrics.observe("http_request_seconds", time.perf_counter() - started, method=method)
+            self.metrics.inc("http_requests_total", method=method, outcome=outcome)
+
+    def backoff_delay(self, attempt):
+        delay = min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_FACTOR * (2 ** attempt))
+        return delay + random.uniform(0, delay * HTTP_BACKOFF_JITTER)
+
+    def retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                return None
+        return min(max(delay, 0), HTTP_RETRY_AFTER_MAX)
+
+    def close(self):
+        self.session.close()
+
+
+def is_unreachable_error(error):
+    # The API could not be reached or is overloaded, as opposed to rejecting the batch
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(error, "response", None)
+    return response is not None and response.status_code in HTTP_RETRY_STATUSES
+
+
+class BatchUploader:
+    """Posts a file's batches with up to max_in_flight requests running concurrently.
+
+    Payloads are pulled from an iterator only when a slot in the window is
+    free, so a full window pauses the CSV reader. Every batch carries an
+    X-Batch-Sequence header and responses are reported in sequence order.
+    Several uploaders can share one executor, each keeping its own window.
+
+    payloads yields (payload, key) pairs; a key is sent in the key_header
+    header and passed back with the batch's response.
+
+    With on_unreachable, a batch that still cannot be delivered after its
+    retries is handed to it (e.g. to be spooled) instead of failing the upload,
+    and so is every later batch of the same upload.
+
+    With a controller (rate_control.AdaptiveController for the destination),
+    every batch also needs a slot in the destination's adaptive window and a
+    token from its rate limit, and every attempt is reported back to it.
+    """
+
+    def __init__(self, transport, max_in_flight=UPLOAD_MAX_IN_FLIGHT, executor=None, key_header=IDEMPOTENCY_HEADER):
+        self.transport = transport
+        self.max_in_flight = max_in_flight
+        self.key_header = key_header
+        self.owns_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="upload")
+        self.executor = executor
+
+    def upload(self, url, payloads, headers, preserve_order=UPLOAD_PRESERVE_ORDER, on_response=None,
+               on_unreachable=None, controller=None):
+        slots = threading.Semaphore(1 if preserve_order else self.max_in_flight)
+        failed = threading.Event()
+        unreachable = threading.Event()
+        in_flight = deque()
+        sent = 0
+
+        def release_slot(future):
+            if future.cancelled() or future.exception() is not None:
+                failed.set()
+            if controller is not None:
+                controller.release_slot()
+            slots.release()
+
+        try:
+            for sequence, (payload, key) in enumerate(payloads):
+                if unreachable.is_set():
+                    on_unreachable(url, payload, self.batch_headers(headers, sequence, key))
+                    sent += 1
+                    continue
+
+                slots.acquire()
+                if failed.is_set():
+                    slots.release()
+                    break
+                if controller is not None:
+                    try:
+                        controller.acquire_slot(self.transport.stop_event)
+                    except InterruptedError:
+                        slots.release()
+                        raise
+
+                future = self.executor.submit(self.post_batch, url, payload, self.batch_headers(headers, sequence, key),
+                                              on_unreachable, unreachable, controller)
+                future.add_done_callback(release_slot)
+                in_flight.append((sequence, key, future))
+
+                while in_flight and in_flight[0][2].done():
+                    sent += self.collect(in_flight.popleft(), on_response)
+
+            while in_flight:
+                sent += self.collect(in_flight.popleft(), on_response)
+        finally:
+            for _, _, future in in_flight:
+                future.cancel()
+        return sent
+
+    def batch_headers(self, headers, sequence, key=None):
+        batch_headers = dict(headers)
+        batch_headers["X-Batch-Sequence"] = str(sequence)
+        if key is not None and self.key_header:
+            batch_headers[self.key_header] = key
+        return batch_headers
+
+    def post_batch(self, url, payload, batch_headers, on_unreachable=None, unreachable=None, controller=None):
+        try:
+            if controller is None:
+                response = self.transport.post(url, data=payload, headers=batch_headers)
+            else:
+                controller.bucket.acquire(self.transport.stop_event)
+                response = self.transport.post(url, data=payload, headers=batch_headers, on_attempt=controller.record)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            if on_unreachable is None or not is_unreachable_error(e):
+                raise
+            unreachable.set()
+            on_unreachable(url, payload, batch_headers)
+            return None
+        return response
+
+    def collect(self, item, on_response):
+        sequence, key, future = item
+        response = future.result()  # re-raises the batch's error
+        if on_response is not None and response is not None:
+            on_response(sequence, response, key)
+        return 1
+
+    def close(self):
+        if self.owns_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,359 @@
+"""Benchmarks for the CSV ingest and upload path.
+
+    python benchmarks/bench_ingest.py                          # every case, one line each
+    python benchmarks/bench_ingest.py --cases load_csv_dirty --rows 500000
+    python benchmarks/bench_ingest.py --json baseline.json     # save the results
+    python benchmarks/bench_ingest.py --compare baseline.json  # exit status 1 on a regression
+
+The CSV files are generated from a fixed seed, so every run reads the same
+data. The API is a mock HTTP server running in its own process, so its work
+does not count against the pipeline. Each case runs in a fresh Python process
+so that its peak RSS is its own.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.server
+import multiprocessing
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SEED = 1234
+DEFAULT_ROWS = 100000
+TOLERANCE = 0.2                     # --compare fails when a case is this much slower
+
+WORDS = ["alpha", "beta", "gamma", "delta", "line 1", "line 2", "OK", "NOK", "Zürich", "São Paulo"]
+
+
+def generate_csv(path, rows, width=8, dirty=False, seed=SEED):
+    # Returns the number of rows the pipeline will send. Dirty files have NUL bytes,
+    # padded cells, blank and all-empty rows, short rows and extra columns.
+    rng = random.Random(seed)
+    valid = 0
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        file.write(",".join(f"Column {index + 1}" for index in range(width)) + "\n")
+        for number in range(rows):
+            if dirty and rng.random() < 0.02:
+                file.write("\n" if rng.random() < 0.5 else "," * (width - 1) + "\n")
+                continue
+            cells = [str(number), f"{rng.uniform(0, 1000):.3f}", rng.choice(WORDS),
+                     f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00"]
+            cells += [str(rng.randint(0, 10 ** 6)) for _ in range(width - len(cells))]
+            cells = cells[:width]
+            if dirty:
+                cells = [f" {cell}\x00" if rng.random() < 0.05 else cell for cell in cells]
+                if rng.random() < 0.05:
+                    cells = cells[:rng.randint(1, len(cells))]
+            file.write(",".join(f'"{cell}"' if "," in cell else cell for cell in cells) + "\n")
+            valid += 1
+    return valid
+
+
+class MockApiHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as a real API would
+    stats = {"requests": 0, "rows": 0, "bytes": 0}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        data = gzip.decompress(body) if self.headers.get("Content-Encoding") == "gzip" else body
+        rows = data.count(b"{")  # one JSON object per record
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["rows"] += rows
+            self.stats["bytes"] += len(body)
+        self.reply(b'{"status":"ok"}')
+
+    def do_GET(self):
+        with self.lock:
+            body = json.dumps(self.stats).encode("utf-8")
+        self.reply(body)
+
+    def reply(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_mock_api(port_queue):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), MockApiHandler)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def api_stats(url):
+    with urllib.request.urlopen(url + "stats") as response:
+        return json.load(response)
+
+
+def peak_rss_mib():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB elsewhere
+
+
+def create_engine(workdir, api_url, **overrides):
+    from transfer_engine import TransferEngine, load_config
+
+    config = load_config()
+    config.update(
+        log_dir=os.path.join(workdir, "logs"),
+        ledger_path=os.path.join(workdir, "ledger.db"),
+        spool_dir=None,
+        log_payload_sample_every=0,
+        http_max_retries=0,
+        network_check_url=api_url + "stats",
+        destination={"url": api_url + "api", "format": "json", "compression": None},
+    )
+    config.update(overrides)
+    return TransferEngine(config)
+
+
+def throughput(seconds, rows, size):
+    return {"seconds": seconds, "rows_per_s": rows / seconds, "mib_per_s": size / seconds / 1024 / 1024}
+
+
+def bench_load_csv(workdir, api_url, rows, width=8, dirty=False, **overrides):
+    # One file through load_csv: read, clean, convert, serialize and post
+    source = os.path.join(workdir, "source")
+    os.makedirs(source)
+    path = os.path.join(source, "data.csv")
+    valid = generate_csv(path, rows, width, dirty)
+
+    engine = create_engine(workdir, api_url, **overrides)
+    try:
+        engine.start(source)
+        before = api_stats(api_url)
+        started = time.perf_counter()
+        state, _, sent, _, error = engine.load_csv(path, engine.routes[0])
+        seconds = time.perf_counter() - started
+    finally:
+        engine.close()
+
+    received = api_stats(api_url)["rows"] - before["rows"]
+    if state != "sent" or sent != valid or received != valid:
+        raise RuntimeError(f"load_csv sent {sent} and the API received {received} of {valid} rows ({error})")
+    return throughput(seconds, valid, os.path.getsize(path))
+
+
+def bench_send_data_to_api(workdir, api_url, rows):
+    # Posting only: the payloads are encoded before the clock starts
+    engine = create_engine(workdir, api_url)
+    try:
+        engine.start(workdir)
+        route = engine.routes[0]
+        destination, encoder = route.destinations[0], route.encoders[0]
+        records = [{f"column_{index + 1}": f"value {number} {index}" for index in range(8)}
+                   for number in range(route.batch_max_rows)]
+        batches = max(1, rows // route.batch_max_rows)
+        payload = encoder.compress(encoder.serialize(records))
+        payloads = [(payload, f"bench-{number}") for number in range(batches)]
+
+        started = time.perf_counter()
+        sent, _ = engine.send_data_to_api(iter(payloads), "bench", route, destination, encoder)
+        seconds = time.perf_counter() - started
+    finally:
+        engine.close()
+
+    if sent != batches:
+        raise RuntimeError(f"send_data_to_api sent {sent} of {batches} batches")
+    result = throughput(seconds, batches * len(records), sum(len(payload) for payload, _ in payloads))
+    result["batches_per_s"] = batches / seconds
+    return result
+
+
+def bench_directory_scan(workdir, api_url, rows):
+    # The first scan of a directory with many files, then scans with nothing new
+    source = os.path.join(workdir, "source")
+    os.makedirs(source)
+    files = max(100, rows // 50)
+    for number in range(files):
+        with open(os.path.join(source, f"file_{number:06d}.csv"), "w") as file:
+            file.write("h\n1,2,3,4,5,6,7,8\n")
+
+    engine = create_engine(workdir, api_url, backfill_existing_files=False)
+    try:
+        engine.start(source)
+        routes = engine.routes
+        started = time.perf_counter()
+        engine.load_new_csv_files(routes[0].directories[0], routes)
+        first_scan = time.perf_counter() - started
+
+        rescans = 20
+        started = time.perf_counter()
+        for _ in range(rescans):
+            engine.scan_routed_directories(routes)
+        idle_scan = (time.perf_counter() - started) / rescans
+    finally:
+        engine.close()
+    return {"seconds": first_scan, "files": files, "files_per_s": files / first_scan, "idle_scan_ms": idle_scan * 1000}
+
+
+def bench_end_to_end(workdir, api_url, rows, files=10):
+    # Latency from a file appearing in the watched directory to its last row reaching the API
+    source = os.path.join(workdir, "source")
+    staging = os.path.join(workdir, "staging")
+    os.makedirs(source)
+    os.makedirs(staging)
+
+    engine = create_engine(workdir, api_url, poll_interval=0.02, network_check_interval=60)
+    shutdown_event = threading.Event()
+    runner = threading.Thread(target=engine.run_forever, args=(shutdown_event,))
+    latencies = []
+    try:
+        engine.start(source)
+        runner.start()
+        time.sleep(0.2)  # the first scan of the empty directory
+        for number in range(files):
+            staged = os.path.join(staging, f"data_{number}.csv")
+            valid = generate_csv(staged, max(1, rows // files), seed=SEED + number)
+            expected = api_stats(api_url)["rows"] + valid
+
+            started = time.perf_counter()
+            os.replace(staged, os.path.join(source, os.path.basename(staged)))
+            while api_stats(api_url)["rows"] < expected:
+                if time.perf_counter() - started > 120:
+                    raise RuntimeError(f"data_{number}.csv did not reach the API")
+                time.sleep(0.002)
+            latencies.append(time.perf_counter() - started)
+    finally:
+        shutdown_event.set()
+        if runner.is_alive():
+            runner.join()
+        engine.close()
+
+    latencies.sort()
+    return {"seconds": sum(latencies), "files": files,
+            "latency_p50_ms": latencies[len(latencies) // 2] * 1000,
+            "latency_max_ms": latencies[-1] * 1000}
+
+
+# name -> (function, keyword arguments, the metric where higher is better)
+CASES = {
+    "load_csv_clean": (bench_load_csv, {}, "rows_per_s"),
+    "load_csv_dirty": (bench_load_csv, {"width": 12, "dirty": True}, "rows_per_s"),
+    "load_csv_wide": (bench_load_csv, {"width": 40}, "rows_per_s"),
+    "load_csv_gzip": (bench_load_csv, {"destination": {"compression": "gzip"}}, "rows_per_s"),
+    "load_csv_parallel": (bench_load_csv, {"parse_processes": 2, "parse_min_file_bytes": 0,
+                                           "parse_chunk_bytes": 1024 * 1024}, "rows_per_s"),
+    "send_data_to_api": (bench_send_data_to_api, {}, "rows_per_s"),
+    "directory_scan": (bench_directory_scan, {}, "files_per_s"),
+    "end_to_end": (bench_end_to_end, {}, None),
+}
+
+
+def run_case(name, api_url, rows):
+    function, kwargs, _ = CASES[name]
+    kwargs = dict(kwargs)
+    if "destination" in kwargs:
+        kwargs["destination"] = dict({"url": api_url + "api", "format": "json"}, **kwargs["destination"])
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        result = function(workdir, api_url, rows, **kwargs)
+    result["peak_rss_mib"] = peak_rss_mib()
+    return result
+
+
+def run_in_subprocess(name, api_url, rows):
+    command = [sys.executable, os.path.abspath(__file__), "--run-case", name,
+               "--api-url", api_url, "--rows", str(rows)]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{name} failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def format_value(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:,.3f}" if value < 100 else f"{value:,.0f}"
+    return f"{value:,}"
+
+
+def compare(results, baseline, tolerance):
+    # Returns the cases whose main metric dropped by more than tolerance
+    regressions = []
+    for name, result in results.items():
+        metric = CASES[name][2]
+        old = baseline.get(name, {})
+        if name == "end_to_end":
+            metric, higher_is_better = "latency_p50_ms", False
+        else:
+            higher_is_better = True
+        if metric not in old or metric not in result:
+            continue
+        change = (result[metric] - old[metric]) / old[metric]
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{name}: {metric} {format_value(old[metric])} -> {format_value(result[metric])} "
+                               f"({change:+.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the CSV ingest and upload path.")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), help="cases to run (default: all)")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="rows per generated file set")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown, e.g. 0.2 = 20%%")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--api-url", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, args.api_url, args.rows)))
+        return 0
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=run_mock_api, args=(port_queue,), daemon=True)
+    server.start()
+    api_url = f"http://127.0.0.1:{port_queue.get(timeout=10)}/"
+
+    results = {}
+    try:
+        for name in args.cases or CASES:
+            print(f"{name} ...", end=" ", flush=True)
+            results[name] = run_in_subprocess(name, api_url, args.rows)
+            print(", ".join(f"{key}={format_value(value)}" for key, value in results[name].items()))
+    finally:
+        server.terminate()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"rows": args.rows, "python": sys.version.split()[0], "results": results}, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline.get("rows") != args.rows:
+            print(f"Note: the baseline was run with {baseline.get('rows')} rows, this run with {args.rows}")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+import io
+import csv
+import itertools
+import mmap
+
+# Cells per row when no schema says otherwise
+ROW_WIDTH = 8
+MMAP_CHUNK_BYTES = 1024 * 1024      # the memory-mapped reader copies out about this much at a time
+MADV_DONTNEED = getattr(mmap, "MADV_DONTNEED", None)  # Linux and macOS only
+
+
+def clean_rows(csv_reader, width=ROW_WIDTH):
+    # Every row is cut or padded to exactly `width` cells
+    for row in csv_reader:
+        row = row[:width]  # Limit to the schema's columns
+        row = [cell.strip().replace('\x00', '') for cell in row]
+
+        if not any(row):  # Skip completely empty rows
+            continue
+
+        if len(row) < width:
+            row += [''] * (width - len(row))
+        yield row
+
+
+class SplitRecordError(ValueError):
+    # A byte range ends inside a quoted field, so its last record continues in the next range
+    pass
+
+
+# Parsed chunks are returned from worker processes as one string, which is much
+# cheaper to pass back than a list of lists
+FIELD_SEPARATOR = '\x1f'
+ROW_SEPARATOR = '\x1e'
+
+
+def parse_byte_range(file_path, start, end, width=ROW_WIDTH):
+    # Runs in a worker process: parses the complete lines between two byte offsets, and
+    # raises SplitRecordError when a quoted field runs on past end
+    with open(file_path, mode='rb') as file:
+        rows = list(iter_mapped_rows(file, {"offset": start}, end, width, whole_records=True))
+    if not rows:
+        return ""
+    packed = ROW_SEPARATOR.join(FIELD_SEPARATOR.join(row) for row in rows)
+    if packed.count(ROW_SEPARATOR) != len(rows) - 1 or packed.count(FIELD_SEPARATOR) != len(rows) * (width - 1):
+        return rows  # the separators occur in the data
+    return packed
+
+
+def unpack_rows(result):
+    if isinstance(result, list):
+        return result
+    if not result:
+        return []
+    return [row.split(FIELD_SEPARATOR) for row in result.split(ROW_SEPARATOR)]
+
+
+def iter_mapped_rows(file, cursor, limit, width=ROW_WIDTH, chunk_bytes=MMAP_CHUNK_BYTES, stop=None,
+                     whole_records=False):
+    # Yields the same rows as clean_rows(csv.reader(...)) for the lines from cursor["offset"]
+    # up to limit, which must be a line boundary or the end of the file. The file is
+    # memory-mapped and copied out a chunk at a time. Lines are split on the bytes and
+    # each line is decoded once, and only its first `width` cells are split off.
+    # cursor["offset"] is advanced past every line. A chunk with quotes or bare \r is
+    # read by the csv module instead, which takes more chunks while a record is still
+    # open and hands back to the fast path once a record ends on a chunk boundary;
+    # the cursor then moves once per chunk.
+    # stop is an optional threading.Event checked between chunks. With whole_records, a
+    # limit before the end of the file that falls inside a quoted field raises
+    # SplitRecordError instead of yielding the first part of the record.
+    start = cursor["offset"]
+    if start >= limit:
+        return
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        limit = min(limit, len(mapped))
+        padding = [''] * width
+        released = start - start % mmap.PAGESIZE
+
+        def next_chunk(position):
+            # End of the chunk starting at position, after dropping the pages already parsed
+            # so the mapping does not add to the RSS
+            nonlocal released
+            if stop is not None and stop.is_set():
+                raise InterruptedError("Data transfer stopped while reading the file.")
+            if MADV_DONTNEED is not None and position - released >= chunk_bytes:
+                boundary = position - position % mmap.PAGESIZE
+                mapped.madvise(MADV_DONTNEED, released, boundary - released)
+                released = boundary
+            end = mapped.find(b"\n", min(position + chunk_bytes, limit) - 1, limit)
+            return limit if end < 0 else end + 1
+
+        def mapped_chunks(data, end, state):
+            # The text of a chunk (data, ending at end), then of the next ones as the csv reader
+            # asks for more lines; state counts the lines (as newline='' splits them) handed out
+            while True:
+                text = data.decode('utf-8')
+                state["lines"] += (text.count('\n') + text.count('\r') - text.count('\r\n')
+                                   + (not text.endswith(('\n', '\r'))))
+                state["end"] = end
+                yield io.StringIO(text, newline='')
+                if end >= limit:
+                    # The reader only asks for more once the last record is still open
+                    if whole_records and limit < len(mapped):
+                        raise SplitRecordError(f"A quoted field runs on past byte {limit}.")
+                    return
+                position = end
+                end = next_chunk(position)
+                data = mapped[position:end]
+
+        while start < limit:
+            end = next_chunk(start)
+            data = mapped[start:end]
+
+            if b'"' in data or data.count(b"\r") != data.count(b"\r\n"):
+                # A quoted field may hold line breaks, so the csv module finds where records end
+                state = {"lines": 0, "end": end}
+                reader = csv.reader(itertools.chain.from_iterable(mapped_chunks(data, end, state)))
+                for row in reader:
+                    # As clean_rows, checking after every record whether it ended on a chunk boundary
+                    row = [cell.strip().replace('\x00', '') for cell in row[:width]]
+                    if any(row):
+                        if len(row) < width:
+                            row += padding[len(row):]
+                        yield row
+                    if reader.line_num == state["lines"]:
+                        break
+                cursor["offset"] = start = state["end"]
+                continue
+
+            has_nul = b"\x00" in data
+            for line in data.split(b"\n"):
+                cursor["offset"] = min(cursor["offset"] + len(line) + 1, end)
+                cells = line.decode('utf-8').split(',', width)
+                if len(cells) > width:
+                    del cells[width]  # the rest of the line
+                if has_nul:
+                    cells = [cell.strip().replace('\x00', '') for cell in cells]
+                else:
+                    cells = [cell.strip() for cell in cells]
+                if not any(cells):  # Skip completely empty rows
+                    continue
+                if len(cells) < width:
+                    cells += padding[len(cells):]
+                yield cells
+            start = end
+
+
+def last_line_end(file, limit, block_size=64 * 1024):
+    # Offset just past the last newline before limit, or 0 if there is none
+    position = limit
+    while position > 0:
+        start = max(0, position - block_size)
+        file.seek(start)
+        index = file.read(position - start).rfind(b"\n")
+        if index >= 0:
+            return start + index + 1
+        position = start
+    return 0
+
+
+def split_byte_ranges(file, start, end, chunk_bytes):
+    # Chunks of about chunk_bytes that always end on a line boundary. A quoted field
+    # containing a line break may be split; parse_byte_range then raises SplitRecordError.
+    ranges = []
+    while start < end:
+        file.seek(min(start + chunk_bytes, end))
+        file.readline()
+        boundary = min(file.tell(), end)
+        ranges.append((start, boundary))
+        start = boundary
+    return ranges
@@ -0,0 +1,222 @@
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import struct
+from collections import namedtuple
+
+# Directory watching: "auto" uses inotify on Linux and the scandir poller elsewhere
+WATCH_BACKEND = "auto"
+WATCH_FULL_RESCAN_TICKS = 60        # poller re-stats every known file this often
+TAIL_ACTIVE_SECONDS = 300           # in tail mode the poller re-stats files modified this recently
+
+# kind is one of "created", "modified", "closed" (finished writing) or "deleted"
+FileEvent = namedtuple("FileEvent", ["kind", "path"])
+
+
+class PollingDirectoryWatcher:
+    """Incremental os.scandir poller that caches mtimes and only re-stats changed entries."""
+
+    def __init__(self, directory, full_rescan_ticks=WATCH_FULL_RESCAN_TICKS, active_seconds=0):
+        self.directory = directory
+        self.full_rescan_ticks = full_rescan_ticks
+        self.active_seconds = active_seconds  # files modified this recently are re-stat'ed every poll
+        self.known = {}     # name -> (size, mtime_ns) of files that have settled
+        self.pending = {}   # name -> (size, mtime_ns) of files that may still be written
+        self.dir_mtime = None
+        self.ticks = 0
+
+    def start(self):
+        # Files already in the directory are reported as complete
+        events = []
+        self.dir_mtime = os.stat(self.directory).st_mtime_ns
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if self.is_csv(entry):
+                    stat = entry.stat()
+                    self.known[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                    events.append(FileEvent("closed", entry.path))
+        return events
+
+    def poll(self):
+        self.ticks += 1
+        events = self.check_pending()
+        if self.active_seconds:
+            events.extend(self.check_active())
+
+        # Adding, removing or renaming entries bumps the directory mtime, so the
+        # listing is only re-read when it changed or a periodic full rescan is due
+        full_rescan = bool(self.full_rescan_ticks) and self.ticks % self.full_rescan_ticks == 0
+        dir_mtime = os.stat(self.directory).st_mtime_ns
+        if dir_mtime != self.dir_mtime or full_rescan:
+            self.dir_mtime = dir_mtime
+            events.extend(self.rescan(restat_known=full_rescan))
+        return events
+
+    def check_pending(self):
+        # A pending file is considered closed once its size and mtime stop changing
+        events = []
+        for name, signature in list(self.pending.items()):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self.pending[name]
+                events.append(FileEvent("deleted", path))
+                continue
+
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current == signature:
+                del self.pending[name]
+                self.known[name] = current
+                events.append(FileEvent("closed", path))
+            else:
+                self.pending[name] = current
+        return events
+
+    def check_active(self):
+        # Appends do not change the directory mtime, so recently written files are watched directly
+        events = []
+        cutoff = time.time_ns() - int(self.active_seconds * 1e9)
+        for name, signature in list(self.known.items()):
+            if signature[1] < cutoff:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # reported as deleted by the next rescan
+            if (stat.st_size, stat.st_mtime_ns) != signature:
+                del self.known[name]
+                self.pending[name] = (stat.st_size, stat.st_mtime_ns)
+                events.append(FileEvent("modified", path))
+        return events
+
+    def rescan(self, restat_known=False):
+        events = []
+        seen = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not self.is_csv(entry):
+                    continue
+                name = entry.name
+                seen.add(name)
+                if name in self.pending or (name in self.known and not restat_known):
+                    continue
+
+                stat = entry.stat()
+                current = (stat.st_size, stat.st_mtime_ns)
+                if name not in self.known:
+                    self.pending[name] = current
+                    events.append(FileEvent("created", entry.path))
+                elif self.known[name] != current:
+                    del self.known[name]
+                    self.pending[name] = current
+                    events.append(FileEvent("modified", entry.path))
+
+        for name in (set(self.known) | set(self.pending)) - seen:
+            self.known.pop(name, None)
+            self.pending.pop(name, None)
+            events.append(FileEvent("deleted", os.path.join(self.directory, name)))
+        return events
+
+    def is_csv(self, entry):
+        return entry.name.endswith('.csv') and entry.is_file()
+
+    def close(self):
+        pass
+
+
+class InotifyDirectoryWatcher:
+    """Linux inotify backend: the kernel queues changes, so idle directories cost nothing."""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, directory, active_seconds=0):
+        # active_seconds is not needed: the kernel reports appends to any file
+        self.directory = directory
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = (self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_FROM |
+                self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE)
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch failed for {directory}")
+
+    def start(self):
+        with os.scandir(self.directory) as entries:
+            return [FileEvent("closed", entry.path) for entry in entries
+                    if entry.name.endswith('.csv') and entry.is_file()]
+
+    def poll(self):
+        events = {}  # keeps arrival order and collapses repeated events per file
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+
+                if mask & self.IN_Q_OVERFLOW:
+                    # Events were lost; report everything so nothing is missed
+                    for event in self.start():
+                        events[event] = None
+                    continue
+                if not name.endswith('.csv'):
+                    continue
+
+                path = os.path.join(self.directory, name)
+                if mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO):
+                    kind = "closed"
+                elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    kind = "deleted"
+                elif mask & self.IN_CREATE:
+                    kind = "created"
+                else:
+                    kind = "modified"
+                events[FileEvent(kind, path)] = None
+        return list(events)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+WATCHER_BACKENDS = {
+    "inotify": InotifyDirectoryWatcher,
+    "poll": PollingDirectoryWatcher,
+}
+
+
+def create_directory_watcher(directory, backend=WATCH_BACKEND, active_seconds=0):
+    # Returns (watcher, fallback): fallback is why "auto" polls on Linux instead of using
+    # inotify, or None; the caller decides how to report it
+    if backend == "auto":
+        fallback = None
+        if sys.platform.startswith("linux"):
+            try:
+                return InotifyDirectoryWatcher(directory), None
+            except (OSError, AttributeError) as e:
+                fallback = f"inotify unavailable ({e})"
+        return PollingDirectoryWatcher(directory, active_seconds=active_seconds), fallback
+    return WATCHER_BACKENDS[backend](directory, active_seconds=active_seconds), None
@@ -0,0 +1,81 @@
+import time
+import threading
+
+import requests
+
+from api_client import HTTP_RETRY_STATUSES, NETWORK_CHECK_TIMEOUT
+
+# Health of the API, learnt from the uploads and from occasional probes
+HEALTH_PROBE_METHOD = "HEAD"        # no body is downloaded; "GET" for a health endpoint that needs it
+HEALTH_IDLE_SECONDS = 30.0          # probe when nothing was answered for this long
+HEALTH_BACKOFF_MIN = 5.0            # first wait between probes while the API is down, then doubles
+HEALTH_BACKOFF_MAX = 60.0
+
+
+class HealthMonitor:
+    """Whether the API is reachable, learnt mostly from the requests sent anyway.
+
+    ApiTransport reports every attempt to observe(): any answer other than a
+    429/5xx means the API is up, and a failed attempt calls for a probe.
+    probe_due() only asks for a probe after idle_seconds without answers,
+    after a failed attempt, or, while the API is down, after a backoff that
+    doubles from backoff_min to backoff_max. probe() sends a HEAD (or the
+    configured method) to the check URL over the shared connection pool.
+
+    connected is the last known status (None until something is known), so it
+    can be read anywhere without a request. on_change(connected) is called,
+    from the thread that noticed it, whenever the status flips.
+    """
+
+    def __init__(self, url, method=HEALTH_PROBE_METHOD, timeout=NETWORK_CHECK_TIMEOUT,
+                 idle_seconds=HEALTH_IDLE_SECONDS, backoff_min=HEALTH_BACKOFF_MIN, backoff_max=HEALTH_BACKOFF_MAX,
+                 on_change=None):
+        self.url = url
+        self.method = method
+        self.timeout = timeout
+        self.idle_seconds = idle_seconds
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.on_change = on_change
+        self.connected = None
+        self.failures = 0       # failed probes in a row
+        self.next_probe = 0     # time.monotonic() when a probe is due
+        self.lock = threading.Lock()
+
+    def probe_due(self):
+        return time.monotonic() >= self.next_probe
+
+    def observe(self, outcome):
+        # outcome is the status code of an answer, or the name of the error of a failed attempt
+        if isinstance(outcome, int) and outcome not in HTTP_RETRY_STATUSES:
+            self.set_status(True, time.monotonic() + self.idle_seconds)
+        else:
+            with self.lock:
+                if self.connected:
+                    self.next_probe = 0  # check now, rather than wait for the uploads to give up
+
+    def probe(self, transport):
+        try:
+            response = transport.request(self.method, self.url, timeout=self.timeout, retries=0, stream=True)
+            response.close()
+            up = response.status_code not in HTTP_RETRY_STATUSES
+        except (requests.RequestException, InterruptedError):
+            up = False
+
+        if up:
+            self.set_status(True, time.monotonic() + self.idle_seconds)
+        else:
+            delay = min(self.backoff_max, self.backoff_min * 2 ** min(self.failures, 16))
+            self.failures += 1
+            self.set_status(False, time.monotonic() + delay)
+        return up
+
+    def set_status(self, connected, next_probe):
+        with self.lock:
+            changed = connected != self.connected
+            self.connected = connected
+            self.next_probe = next_probe
+            if connected:
+                self.failures = 0
+        if changed and self.on_change is not None:
+            self.on_change(connected)
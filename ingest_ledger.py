@@ -0,0 +1,234 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+LEDGER_PATH = "ingest_ledger.db"
+ACKED_CACHE_SIZE = 100000           # acknowledged batch keys also kept in memory
+FILE_RETRY_BACKOFF = 30.0           # seconds before a file that failed to send is tried again
+FILE_RETRY_BACKOFF_MAX = 15 * 60    # the wait doubles after each failure, up to this
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IngestLedger:
+    """SQLite record of every CSV file seen, keyed by path, size, mtime and content hash.
+
+    Files are queued per route in arrival order and move from pending to
+    sending to sent/failed, so a restart resumes with the first file not yet sent.
+    byte_offset and rows_sent checkpoint how much of a file has been sent,
+    which tail mode uses to send only what was appended. A file that grows
+    while it is being sent is flagged as appended and queued again when
+    the send finishes. A file that failed to send waits until retry_after,
+    and the files queued behind it on its route wait with it.
+
+    acked_batches holds the idempotency key of every batch an API accepted,
+    with the most recent ones cached in memory, so batches are not sent twice.
+    """
+
+    def __init__(self, path=LEDGER_PATH, acked_cache_size=ACKED_CACHE_SIZE, retry_backoff=FILE_RETRY_BACKOFF):
+        self.lock = threading.Lock()
+        self.retry_backoff = retry_backoff
+        self.acked_cache = OrderedDict()
+        self.acked_cache_size = acked_cache_size
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                discovered_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                UNIQUE (path, size, mtime_ns)
+            );
+            CREATE INDEX IF NOT EXISTS files_state ON files (state, id);
+            CREATE INDEX IF NOT EXISTS files_path ON files (path, id);
+            CREATE TABLE IF NOT EXISTS acked_batches (
+                url TEXT NOT NULL,
+                batch_key TEXT NOT NULL,
+                acked_at REAL NOT NULL,
+                PRIMARY KEY (url, batch_key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS acked_batches_time ON acked_batches (acked_at);
+        """)
+        # Columns added after the first release are added to existing ledgers here
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+        for name, definition in (("inode", "INTEGER"),
+                                 ("byte_offset", "INTEGER NOT NULL DEFAULT 0"),
+                                 ("rows_sent", "INTEGER NOT NULL DEFAULT 0"),
+                                 ("route", "TEXT NOT NULL DEFAULT 'default'"),
+                                 ("rows_rejected", "INTEGER NOT NULL DEFAULT 0"),
+                                 ("appended", "INTEGER NOT NULL DEFAULT 0"),
+                                 ("retry_after", "REAL NOT NULL DEFAULT 0")):
+            if name not in columns:
+                self.conn.execute(f"ALTER TABLE files ADD COLUMN {name} {definition}")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_route ON files (route, state, id)")
+        # A file that was being sent when the app stopped is sent again
+        self.conn.execute("UPDATE files SET state = 'pending' WHERE state = 'sending'")
+        self.conn.commit()
+
+    def has_files_in(self, directory):
+        prefix = os.path.join(directory, "")
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM files WHERE substr(path, 1, ?) = ? LIMIT 1",
+                (len(prefix), prefix)).fetchone()
+        return row is not None
+
+    def is_known(self, path, stat):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        return row is not None
+
+    def enqueue(self, path, state="pending", tail=False, route="default"):
+        # Known files are recognised from their stat alone, so they are never re-read
+        stat = os.stat(path)
+        if self.is_known(path, stat):
+            return False
+
+        now = time.time()
+        if tail and state == "pending" and self.requeue_appended(path, stat, now, route):
+            return True
+
+        # In tail mode the content keeps changing, so it is not hashed
+        content_hash = file_sha256(path) if state == "pending" and not tail else None
+        with self.lock:
+            if content_hash is not None:
+                # Same content under the same name (e.g. the file was only touched)
+                row = self.conn.execute(
+                    "SELECT 1 FROM files WHERE path = ? AND content_hash = ? AND state = 'sent'",
+                    (path, content_hash)).fetchone()
+                if row is not None:
+                    state = "duplicate"
+
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO files "
+                "(path, size, mtime_ns, content_hash, state, inode, route, discovered_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, content_hash, state, stat.st_ino, route, now, now))
+            self.conn.commit()
+        return cursor.rowcount == 1 and state == "pending"
+
+    def requeue_appended(self, path, stat, now, route="default"):
+        # The same file (same inode) that has only grown is queued again from its
+        # checkpoint; a truncated or replaced file gets a new entry starting at 0
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, inode, byte_offset, state FROM files WHERE path = ? ORDER BY id DESC LIMIT 1",
+                (path,)).fetchone()
+            if row is None or row[1] != stat.st_ino or stat.st_size < row[2]:
+                return False
+
+            if row[3] == "sending":
+                # The send in progress may stop short of the new lines, so finish() queues it again
+                self.conn.execute(
+                    "UPDATE files SET size = ?, mtime_ns = ?, appended = 1, updated_at = ? WHERE id = ?",
+                    (stat.st_size, stat.st_mtime_ns, now, row[0]))
+                self.conn.commit()
+                return True
+
+            self.conn.execute(
+                "UPDATE files SET size = ?, mtime_ns = ?, state = 'pending', error = NULL, route = ?, updated_at = ? "
+                "WHERE id = ?",
+                (stat.st_size, stat.st_mtime_ns, route, now, row[0]))
+            self.conn.commit()
+        return True
+
+    def pending_routes(self):
+        # Routes whose first pending file is due (with MIN(), SQLite takes retry_after from that row)
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT route, retry_after, MIN(id) FROM files WHERE state = 'pending' GROUP BY route").fetchall()
+        now = time.time()
+        return {row[0] for row in rows if row[1] <= now}
+
+    def next_pending(self, route="default"):
+        # Files are sent in arrival order, so while the first one waits to be retried, so does the route
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, path, attempts, byte_offset, retry_after FROM files "
+                "WHERE route = ? AND state = 'pending' ORDER BY id LIMIT 1", (route,)).fetchone()
+            if row is not None and row[4] > time.time():
+                return None
+            if row is not None:
+                row = row[:4]
+                self.conn.execute(
+                    "UPDATE files SET state = 'sending', appended = 0, updated_at = ? WHERE id = ?",
+                    (time.time(), row[0]))
+                self.conn.commit()
+        return row
+
+    def finish(self, file_id, state, error=None, byte_offset=None, rows=0, rejected=0, count_attempt=True):
+        # The checkpoint only moves forward once everything up to byte_offset was sent;
+        # count_attempt=False leaves a file that could not be tried yet its attempts, and
+        # lets it be tried again straight away. A counted failure backs off exponentially.
+        now = time.time()
+        with self.lock:
+            if state == "sent":
+                # Lines appended during the send are sent next, from the new checkpoint
+                self.conn.execute(
+                    "UPDATE files SET state = CASE WHEN appended THEN 'pending' ELSE 'sent' END, appended = 0, "
+                    "error = NULL, updated_at = ?, attempts = 0, retry_after = 0, "
+                    "byte_offset = COALESCE(?, byte_offset), rows_sent = rows_sent + ?, "
+                    "rows_rejected = rows_rejected + ? WHERE id = ?",
+                    (now, byte_offset, rows, rejected, file_id))
+            else:
+                retry_after = 0
+                if state == "pending" and count_attempt:
+                    attempts = self.conn.execute("SELECT attempts FROM files WHERE id = ?", (file_id,)).fetchone()[0]
+                    retry_after = now + min(FILE_RETRY_BACKOFF_MAX, self.retry_backoff * 2 ** attempts)
+                self.conn.execute(
+                    "UPDATE files SET state = ?, error = ?, updated_at = ?, attempts = attempts + ?, retry_after = ? "
+                    "WHERE id = ?",
+                    (state, error, now, int(count_attempt), retry_after, file_id))
+            self.conn.commit()
+
+    def is_acked(self, url, key):
+        with self.lock:
+            if (url, key) in self.acked_cache:
+                self.acked_cache.move_to_end((url, key))
+                return True
+            row = self.conn.execute(
+                "SELECT 1 FROM acked_batches WHERE url = ? AND batch_key = ?", (url, key)).fetchone()
+            if row is not None:
+                self.cache_acked(url, key)
+        return row is not None
+
+    def record_acked(self, url, key):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO acked_batches (url, batch_key, acked_at) VALUES (?, ?, ?)",
+                (url, key, time.time()))
+            self.conn.commit()
+            self.cache_acked(url, key)
+
+    def cache_acked(self, url, key):
+        self.acked_cache[(url, key)] = None
+        self.acked_cache.move_to_end((url, key))
+        if len(self.acked_cache) > self.acked_cache_size:
+            self.acked_cache.popitem(last=False)
+
+    def prune_acked(self, before):
+        with self.lock:
+            self.conn.execute("DELETE FROM acked_batches WHERE acked_at < ?", (before,))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,120 @@
+import re
+import bisect
+from array import array
+
+# Reading large log files without loading them whole
+LOG_INDEX_BLOCK_BYTES = 4 * 1024 * 1024     # the file is scanned in blocks of this size
+LOG_VIEW_MAX_ENTRY_CHARS = 20000            # longer entries (payload dumps) are cut when shown
+
+# Start of a record written by transfer_logging: "2025-01-31 12:00:00 - INFO - message"
+RECORD_START = re.compile(rb"\n(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d) - ([A-Z]+) - ")
+LEVELS = {b"DEBUG": 1, b"INFO": 2, b"WARNING": 3, b"ERROR": 4, b"CRITICAL": 5}
+LEVEL_NAMES = {name.decode(): number for name, number in LEVELS.items()}
+
+
+def time_key(timestamp, fill="0"):
+    # "2025-01-31 12:00:00" -> 20250131120000, so times compare as integers; a shorter
+    # time such as "2025-01-31 12" is filled up with fill ("9" for the end of a range)
+    digits = re.sub(r"\D", "", timestamp)
+    return int(digits[:14].ljust(14, fill))
+
+
+class LogIndex:
+    """Byte offset, time and level of every record in a log file.
+
+    The file is scanned once in blocks (and again from where it stopped by
+    update(), for a file that is still growing); records are then read one
+    page at a time, and filtered by level and time from the index alone.
+    A record runs from its offset to the next record's, so multi-line
+    payload dumps are one record.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = array("q")
+        self.times = array("q")
+        self.levels = bytearray()
+        self.end = 0            # bytes of the file indexed so far
+        self.carry = b"\n"      # the unfinished last line of the previous block
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def update(self, stop=None):
+        # Indexes what was appended since the last call; stop is an optional threading.Event
+        with open(self.path, "rb") as file:
+            file.seek(self.end)
+            while stop is None or not stop.is_set():
+                block = file.read(LOG_INDEX_BLOCK_BYTES)
+                if not block:
+                    break
+                data = self.carry + block
+                base = self.end - len(self.carry)  # file offset of data[0]
+                last_line = data.rfind(b"\n")
+                for match in RECORD_START.finditer(data, 0, len(data)):
+                    if match.start() >= last_line:
+                        break  # the line may not be complete yet
+                    self.offsets.append(base + match.start() + 1)
+                    self.times.append(time_key(match.group(1).decode("ascii")))
+                    self.levels.append(LEVELS.get(match.group(2), 0))
+                self.carry = data[last_line:]
+                self.end += len(block)
+        return len(self.offsets)
+
+    def record_end(self, number):
+        return self.offsets[number + 1] if number + 1 < len(self.offsets) else self.end
+
+    def filter(self, min_level=None, start=None, end=None, text=None, stop=None):
+        # Record numbers matching every given condition. start and end are times such as
+        # "2025-01-31 12:00:00", or a part of one ("2025-01-31 12" is the whole hour).
+        numbers = range(len(self.offsets))
+        if start or end:
+            # Records from several threads are not always in strict time order, so every one is checked
+            low = time_key(start) if start else 0
+            high = time_key(end, "9") if end else time_key("", "9")
+            times = self.times
+            numbers = [number for number in numbers if low <= times[number] <= high]
+        if min_level:
+            levels = self.levels
+            numbers = [number for number in numbers if levels[number] >= min_level]
+        if text:
+            matches = self.search(text, numbers, stop)
+            numbers = [number for number in numbers if number in matches]
+        return numbers
+
+    def search(self, text, numbers, stop=None):
+        # Records containing text (case-insensitive), found by scanning only the part of
+        # the file the candidate records span, a block at a time
+        if not len(numbers):
+            return set()
+        needle = text.encode("utf-8").lower()
+        position = self.offsets[numbers[0]]
+        limit = self.record_end(numbers[-1])
+        overlap = len(needle) - 1
+        found = set()
+        with open(self.path, "rb") as file:
+            while position < limit and (stop is None or not stop.is_set()):
+                file.seek(position)
+                block = file.read(min(LOG_INDEX_BLOCK_BYTES, limit - position) + overlap).lower()
+                index = block.find(needle)
+                while index >= 0:
+                    number = bisect.bisect_right(self.offsets, position + index) - 1
+                    found.add(number)
+                    index = block.find(needle, max(self.record_end(number) - position, index + 1))  # next record
+                position += LOG_INDEX_BLOCK_BYTES
+        return found
+
+    def read(self, numbers, max_chars=LOG_VIEW_MAX_ENTRY_CHARS):
+        # Text of the given records, each cut to max_chars
+        records = []
+        with open(self.path, "rb") as file:
+            for number in numbers:
+                start = self.offsets[number]
+                length = self.record_end(number) - start
+                file.seek(start)
+                data = file.read(min(length, max_chars * 4))
+                text = data.decode("utf-8", "replace").rstrip("\n")
+                if len(text) > max_chars or length > len(data):
+                    text = f"{text[:max_chars]}... ({length} bytes in total)"
+                records.append(text)
+        return records
@@ -0,0 +1,211 @@
+import os
+import io
+import time
+import pstats
+import bisect
+import cProfile
+import threading
+import tracemalloc
+import http.server
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+METRICS_HOST = "127.0.0.1"          # the endpoint is local only unless configured otherwise
+PROFILE_TOP = 20                    # functions and allocation sites listed in a profile summary
+
+
+class Histogram:
+    """Counts of observations per bucket, with their sum, as in a Prometheus histogram."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation (the largest bucket for +Inf)
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Counters, gauges and latency histograms of the pipeline, updated from any thread.
+
+    Names and labels follow Prometheus conventions; labels are keyword arguments.
+    Gauges are functions read when the metrics are rendered. render() returns
+    the Prometheus text format served by MetricsServer.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}      # (name, labels) -> value
+        self.histograms = {}    # (name, labels) -> Histogram
+        self.gauges = {}        # name -> function
+        self.help = {}
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def time(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def gauge(self, name, function):
+        self.gauges[name] = function
+
+    def total(self, name):
+        # A counter summed over all its labels
+        with self.lock:
+            return sum(value for (counter, _), value in self.counters.items() if counter == name)
+
+    def histogram_summary(self, name, label):
+        # {label value: (count, mean, p50, p95)} of a histogram, e.g. per stage
+        with self.lock:
+            summary = {}
+            for (histogram_name, labels), histogram in self.histograms.items():
+                if histogram_name == name and histogram.count:
+                    summary[dict(labels).get(label)] = (
+                        histogram.count, histogram.sum / histogram.count,
+                        histogram.quantile(0.5), histogram.quantile(0.95))
+            return summary
+
+    def render(self):
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            # Bucket counts are copied so the text is consistent with the sum and count
+            histograms = [(key, list(histogram.counts), histogram.count, histogram.sum)
+                          for key, histogram in histograms]
+
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for name, function in sorted(self.gauges.items()):
+            try:
+                value = function()
+            except Exception:
+                continue  # e.g. the spool is closed while the engine shuts down
+            header(name, "gauge")
+            lines.append(f"{name} {value}")
+
+        for (name, labels), counts, count, total in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{escape_label(value)}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsServer:
+    """Serves Metrics.render() at /metrics over HTTP from a daemon thread."""
+
+    def __init__(self, metrics, port, host=METRICS_HOST):
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # scrapes are not logged
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def profile_call(output_path, function, *args):
+    # Runs function under cProfile and tracemalloc; the profile is saved to output_path
+    # (open it with pstats or snakeviz) and a text summary is returned with the result.
+    # Only the calling thread is profiled, so uploads on other threads do not show up.
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(function, *args)
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    profiler.dump_stats(output_path)
+
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    text.write(f"Memory: peak {peak / 1024 / 1024:.1f} MiB traced, {current / 1024 / 1024:.1f} MiB still allocated\n")
+    for statistic in snapshot.statistics("lineno")[:PROFILE_TOP]:
+        text.write(f"{statistic}\n")
+    return result, text.getvalue()
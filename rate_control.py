@@ -0,0 +1,132 @@
+import time
+import threading
+
+# Adaptive upload control (AIMD) per destination
+ADAPTIVE_LATENCY_TARGET = 2.0       # seconds; slower responses count as a sign of overload
+ADAPTIVE_MIN_IN_FLIGHT = 1
+ADAPTIVE_BATCH_MIN_FRACTION = 1.0   # batches may shrink to this fraction of the configured size (1.0 = fixed)
+ADAPTIVE_BATCH_STEP = 0.1           # batches grow back by this fraction of the configured size
+OVERLOAD_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """Lets at most `rate` requests per second through, with bursts of up to `burst`.
+
+    rate 0 means no limit. pause() holds every request back for a while,
+    e.g. for the Retry-After of a 429 answer.
+    """
+
+    def __init__(self, rate=0, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, stop_event=None):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if not self.rate:
+                        return
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+
+            if stop_event is None:
+                time.sleep(wait)
+            elif stop_event.wait(wait):
+                raise InterruptedError("Data transfer stopped while waiting to send.")
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class AdaptiveController:
+    """AIMD control of the requests in flight to one destination, and of its batch size.
+
+    Every request attempt is reported to record(). A 429/5xx answer, a connection
+    error or a response slower than latency_target halves the window of requests
+    in flight and the batch size (multiplicative decrease); the answers to the
+    other requests that were already in flight then do not halve them again.
+    After a full window of fast, successful answers the window grows by one
+    and batches by ADAPTIVE_BATCH_STEP (additive increase), up to the ceilings.
+    The window is shared by every upload to the destination.
+    """
+
+    def __init__(self, max_in_flight, min_in_flight=ADAPTIVE_MIN_IN_FLIGHT, batch_min_fraction=ADAPTIVE_BATCH_MIN_FRACTION,
+                 latency_target=ADAPTIVE_LATENCY_TARGET, rate=0):
+        self.max_in_flight = max(1, max_in_flight)
+        self.min_in_flight = max(1, min(min_in_flight, self.max_in_flight))
+        self.batch_min_fraction = min(max(batch_min_fraction, 0.0), 1.0)
+        self.latency_target = latency_target
+        self.bucket = TokenBucket(rate)
+
+        self.in_flight_limit = self.max_in_flight   # starts at the ceiling, as before
+        self.batch_fraction = 1.0
+        self.active = 0
+        self.good = 0           # fast answers since the window last changed
+        self.ignore = 0         # answers still due from requests sent before the last decrease
+        self.decreases = 0
+        self.window = threading.Condition()
+
+    def acquire_slot(self, stop_event=None):
+        with self.window:
+            while self.active >= self.in_flight_limit:
+                if stop_event is not None and stop_event.is_set():
+                    raise InterruptedError("Data transfer stopped while waiting to send.")
+                self.window.wait(0.5)
+            self.active += 1
+
+    def release_slot(self):
+        with self.window:
+            self.active -= 1
+            self.window.notify_all()
+
+    def batch_limits(self, max_rows, max_bytes):
+        # The route's configured batch limits scaled to the current batch size (0 = no limit)
+        fraction = self.batch_fraction
+        return (max(1, int(max_rows * fraction)) if max_rows else 0,
+                max(1, int(max_bytes * fraction)) if max_bytes else 0)
+
+    def record(self, seconds, status=None, retry_after=None):
+        # status is None when the request failed without an answer
+        overloaded = (status is None or status in OVERLOAD_STATUSES
+                      or bool(self.latency_target and seconds > self.latency_target))
+        if retry_after:
+            self.bucket.pause(retry_after)
+
+        with self.window:
+            if self.ignore:
+                self.ignore -= 1
+                if overloaded:
+                    return
+            if overloaded:
+                self.ignore = self.active  # their answers reflect the load before this decrease
+                self.good = 0
+                self.in_flight_limit = max(self.min_in_flight, self.in_flight_limit // 2)
+                self.batch_fraction = max(self.batch_min_fraction, self.batch_fraction / 2)
+                self.decreases += 1
+                return
+
+            self.good += 1
+            if self.good >= self.in_flight_limit:
+                self.good = 0
+                self.in_flight_limit = min(self.max_in_flight, self.in_flight_limit + 1)
+                self.batch_fraction = min(1.0, self.batch_fraction + ADAPTIVE_BATCH_STEP)
+                self.window.notify_all()
+
+    def describe(self):
+        text = f"{self.in_flight_limit}/{self.max_in_flight} in flight"
+        if self.batch_min_fraction < 1.0:
+            text += f", batches {self.batch_fraction:.0%}"
+        if self.bucket.rate:
+            text += f", max {self.bucket.rate:g}/s"
+        return text
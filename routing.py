@@ -0,0 +1,78 @@
+import os
+import glob
+import fnmatch
+
+from api_client import PayloadEncoder
+from schema import Schema
+
+# Settings a routing table entry may have; missing ones fall back to the top-level config
+ROUTE_SETTINGS = {
+    "name", "directory", "pattern", "destinations",
+    "max_in_flight", "batch_max_rows", "batch_max_bytes", "preserve_order", "schema",
+}
+
+
+class Route:
+    """One routing table entry: CSV files in `directories` whose names match `pattern`.
+
+    A file is sent to each destination in turn. The route keeps its own
+    schema, upload window and batch limits, and the engine gives it its own uploader.
+    """
+
+    def __init__(self, name, directories, destinations, pattern="*.csv", max_in_flight=4,
+                 batch_max_rows=0, batch_max_bytes=0, preserve_order=False, schema=None):
+        self.name = name
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.destinations = destinations
+        self.encoders = [PayloadEncoder(destination) for destination in destinations]
+        self.pattern = pattern
+        self.max_in_flight = max_in_flight
+        self.batch_max_rows = batch_max_rows
+        self.batch_max_bytes = batch_max_bytes
+        self.preserve_order = preserve_order
+        self.schema = Schema.from_config(schema)
+        self.uploader = None
+
+    def matches(self, path):
+        return (os.path.dirname(path) in self.directories
+                and fnmatch.fnmatch(os.path.basename(path), self.pattern))
+
+
+def build_routes(config, directory=None):
+    # Configured routes come first; the top-level directory and destination form
+    # the "default" route. A file belongs to the first route that matches it.
+    entries = list(config["routes"])
+    directory = directory or config["source_directory"]
+    if directory:
+        entries.append({"name": "default", "directory": directory})
+
+    routes = []
+    for entry in entries:
+        unknown = set(entry) - ROUTE_SETTINGS
+        if unknown:
+            raise ValueError(f"Unknown route setting(s): {', '.join(sorted(unknown))}")
+        if "directory" not in entry:
+            raise ValueError(f"Route {entry.get('name', len(routes) + 1)} has no directory")
+
+        # A directory pattern is expanded when the transfer starts
+        pattern = entry["directory"]
+        directories = sorted(path for path in glob.glob(pattern) if os.path.isdir(path)) or [pattern]
+        destinations = [dict(config["destination"], **destination)
+                        for destination in entry.get("destinations") or [{}]]
+
+        routes.append(Route(
+            entry.get("name") or pattern,
+            directories,
+            destinations,
+            pattern=entry.get("pattern", "*.csv"),
+            max_in_flight=entry.get("max_in_flight", config["upload_max_in_flight"]),
+            batch_max_rows=entry.get("batch_max_rows", config["batch_max_rows"]),
+            batch_max_bytes=entry.get("batch_max_bytes", config["batch_max_bytes"]),
+            preserve_order=entry.get("preserve_order", config["upload_preserve_order"]),
+            schema=entry.get("schema", config["schema"]),
+        ))
+
+    names = [route.name for route in routes]
+    if len(names) != len(set(names)):
+        raise ValueError("Route names must be unique")
+    return routes
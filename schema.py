@@ -0,0 +1,205 @@
+import re
+import csv
+import math
+from datetime import date, datetime
+
+# JSON item names for the 8 CSV columns, in column order (the schema used when none is configured)
+COLUMN_NAMES = [
+    'column_1', 'column_2', 'column_3', 'column_4',
+    'column_5', 'column_6', 'column_7', 'column_8',
+]
+
+BOOL_VALUES = {
+    "true": True, "false": False, "1": True, "0": False,
+    "yes": True, "no": False, "y": True, "n": False,
+}
+
+# Settings of a schema column; only name is needed
+COLUMN_SETTINGS = {"name", "type", "nullable", "required", "source", "format"}
+
+# Numbers as the CSV writes them: ASCII digits only, no "_" separators
+INT_PATTERN = re.compile(r"[+-]?[0-9]+")
+FLOAT_PATTERN = re.compile(r"[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?")
+
+
+def int_converter(fmt):
+    # int() alone would also take "1_000" and non-ASCII digits such as "٣"
+    def convert(value):
+        if not INT_PATTERN.fullmatch(value):
+            raise ValueError(f"invalid int: {value!r}")
+        return int(value)
+    return convert
+
+
+def float_converter(fmt):
+    # nan, inf and overflowing values such as 1e999 would be sent as NaN/Infinity, which is not JSON
+    def convert(value):
+        if not FLOAT_PATTERN.fullmatch(value):
+            raise ValueError(f"invalid float: {value!r}")
+        number = float(value)
+        if not math.isfinite(number):
+            raise ValueError(f"float out of range: {value!r}")
+        return number
+    return convert
+
+
+def datetime_converter(fmt):
+    # Dates are sent as ISO 8601 strings, whatever format the CSV uses
+    if fmt:
+        return lambda value: datetime.strptime(value, fmt).isoformat()
+    return lambda value: datetime.fromisoformat(value).isoformat()
+
+
+def date_converter(fmt):
+    if fmt:
+        return lambda value: datetime.strptime(value, fmt).date().isoformat()
+    return lambda value: date.fromisoformat(value).isoformat()
+
+
+class Column:
+    """One schema column: the JSON name, where the value comes from and how it is converted.
+
+    source is a header name or a 0-based column position; by default it is the
+    column's position in the schema. Empty cells are only allowed when nullable,
+    and are sent as null for every type except string.
+    """
+
+    CONVERTERS = {
+        "string": lambda fmt: None,
+        "int": int_converter,
+        "float": float_converter,
+        "bool": lambda fmt: lambda value: BOOL_VALUES[value.lower()],
+        "datetime": datetime_converter,
+        "date": date_converter,
+    }
+
+    def __init__(self, name, type="string", nullable=True, required=False, source=None, format=None):
+        if type not in self.CONVERTERS:
+            raise ValueError(f"Unsupported type for column {name}: {type}")
+        self.name = name
+        self.type = type
+        self.nullable = nullable
+        self.required = required
+        self.source = source
+        self.converter = self.CONVERTERS[type](format)
+
+
+class Schema:
+    """Maps cleaned CSV rows to typed records, column by column.
+
+    Each column of a batch is converted in one pass over the whole column;
+    a row with a value that cannot be converted, or an empty value in a
+    column that is not nullable, is rejected on its own.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.names = [column.name for column in columns]
+        self.needs_header = any(isinstance(column.source, str) for column in columns)
+
+    @classmethod
+    def from_config(cls, columns=None):
+        if not columns:
+            return cls([Column(name) for name in COLUMN_NAMES])
+
+        specs = []
+        for column in columns:
+            if isinstance(column, str):
+                column = {"name": column}
+            unknown = set(column) - COLUMN_SETTINGS
+            if unknown:
+                raise ValueError(f"Unknown schema setting(s): {', '.join(sorted(unknown))}")
+            specs.append(Column(**column))
+        return cls(specs)
+
+    def bind(self, header=None):
+        # Returns the position of each column in the row (None when a column is absent);
+        # rows are cut or padded to `width` cells by the parser
+        positions = []
+        header_index = {}
+        if header is not None:
+            header_index = {name.strip(): index for index, name in enumerate(header)}
+
+        for position, column in enumerate(self.columns):
+            source = position if column.source is None else column.source
+            if isinstance(source, str):
+                source = header_index.get(source)
+                if source is None and column.required:
+                    raise ValueError(f"Required column '{column.source}' is not in the CSV header.")
+            positions.append(source)
+        return positions
+
+    def width(self, positions):
+        return max((position + 1 for position in positions if position is not None), default=0)
+
+    def convert(self, rows, positions):
+        # Returns (records, rejected) where rejected is a list of (row, reason)
+        row_count = len(rows)
+        cells = list(zip(*rows)) if rows else []
+        values_by_column = []
+        bad = {}  # row index -> reason
+
+        for column, position in zip(self.columns, positions):
+            if position is None or position >= len(cells):
+                values = [None] * row_count
+                if not column.nullable:
+                    for index in range(row_count):
+                        bad.setdefault(index, f"{column.name} is missing")
+                values_by_column.append(values)
+                continue
+
+            values = cells[position]
+            has_empty = '' in values
+            if column.converter is None:
+                converted = list(values)
+            else:
+                converted = None
+                if not has_empty:
+                    try:
+                        converted = list(map(column.converter, values))  # the whole column in one pass
+                    except (ValueError, KeyError, OverflowError):
+                        pass
+                if converted is None:
+                    converted = self.convert_cells(column, values, bad)
+
+            if has_empty:
+                # Empty strings are sent as they are; other types get null
+                for index, value in enumerate(values):
+                    if value == '':
+                        if not column.nullable:
+                            bad.setdefault(index, f"{column.name} is empty")
+                        if column.converter is not None:
+                            converted[index] = None
+            values_by_column.append(converted)
+
+        names = self.names
+        if not bad:
+            return [dict(zip(names, values)) for values in zip(*values_by_column)], []
+
+        records = []
+        rejected = []
+        for index, values in enumerate(zip(*values_by_column)):
+            if index in bad:
+                rejected.append((rows[index], bad[index]))
+            else:
+                records.append(dict(zip(names, values)))
+        return records, rejected
+
+    def convert_cells(self, column, values, bad):
+        # Slow path for a column with empty or invalid cells
+        converted = []
+        for index, value in enumerate(values):
+            if value == '':
+                converted.append(None)
+                continue
+            try:
+                converted.append(column.converter(value))
+            except (ValueError, KeyError, OverflowError):
+                bad.setdefault(index, f"{column.name}: {value!r} is not a valid {column.type}")
+                converted.append(None)
+        return converted
+
+
+def read_header(file_path):
+    with open(file_path, newline='', encoding='utf-8-sig') as file:
+        return next(csv.reader(file), None)
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+SPOOL_MAX_BYTES = 1024 * 1024 * 1024        # disk space the spool may use
+SPOOL_SEGMENT_BYTES = 64 * 1024 * 1024      # payloads are appended to segment files of about this size
+SPOOL_EVICTION = "drop_oldest"              # "drop_oldest" segments, or "reject" new batches, when full
+SPOOL_RETRY_BACKOFF = 30.0                  # a batch the API failed is retried after this long, then doubling
+SPOOL_RETRY_BACKOFF_MAX = 60 * 60
+SPOOL_MAX_ATTEMPTS = 8                      # then the batch is moved to the dead letter directory
+SPOOL_DRAIN_MAX_FAILURES = 3                # failed batches in a row that pause a drain (the API looks down)
+DEAD_LETTER_DIR = "dead_letter"
+
+
+class SpoolFullError(OSError):
+    pass
+
+
+class BatchSpool:
+    """Encoded batches waiting for the API, kept on disk so they survive outages and restarts.
+
+    Payloads are appended to segment files (segment_<n>.bin) and an SQLite index
+    records where each batch is, its URL and its headers, in arrival order.
+    A segment file is deleted once every batch in it has been sent.
+
+    A batch the API failed is retried later (retry_later), with a backoff that
+    doubles on every attempt, while the batches behind it go ahead. Batches
+    that are given up on are moved to the dead_letter directory (dead_letter).
+    """
+
+    def __init__(self, directory, max_bytes=SPOOL_MAX_BYTES, segment_bytes=SPOOL_SEGMENT_BYTES,
+                 eviction=SPOOL_EVICTION, retry_backoff=SPOOL_RETRY_BACKOFF):
+        if eviction not in ("drop_oldest", "reject"):
+            raise ValueError(f"Unsupported spool eviction policy: {eviction}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.eviction = eviction
+        self.retry_backoff = retry_backoff
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS batches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                headers TEXT NOT NULL,
+                route TEXT,
+                spooled_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS batches_url ON batches (url, id);
+            CREATE INDEX IF NOT EXISTS batches_segment ON batches (segment);
+        """)
+        # Columns added after the first release are added to existing spools here
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(batches)")}
+        for name, definition in (("attempts", "INTEGER NOT NULL DEFAULT 0"),
+                                 ("next_attempt_at", "REAL NOT NULL DEFAULT 0")):
+            if name not in columns:
+                self.conn.execute(f"ALTER TABLE batches ADD COLUMN {name} {definition}")
+        self.conn.commit()
+
+        # Segments no batch refers to any more (e.g. after a crash) are removed
+        live = {row[0] for row in self.conn.execute("SELECT DISTINCT segment FROM batches")}
+        segments = sorted(self.segment_number(name) for name in os.listdir(directory)
+                          if name.startswith("segment_") and name.endswith(".bin"))
+        self.active = max(segments + list(live), default=0)
+        for segment in segments:
+            if segment not in live and segment != self.active:
+                os.remove(self.segment_path(segment))
+        self.total_bytes = sum(os.path.getsize(self.segment_path(segment))
+                               for segment in set(segments) & (live | {self.active}))
+
+    def segment_number(self, name):
+        return int(name[len("segment_"):-len(".bin")])
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, f"segment_{segment}.bin")
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+
+    def has_batches(self, url=None, include_retried=True):
+        # include_retried=False ignores batches the API already failed on their own
+        # (they wait for their retry apart from the queue)
+        condition = "" if include_retried else " AND attempts = 0"
+        with self.lock:
+            if url is None:
+                row = self.conn.execute(f"SELECT 1 FROM batches WHERE 1{condition} LIMIT 1").fetchone()
+            else:
+                row = self.conn.execute(
+                    f"SELECT 1 FROM batches WHERE url = ?{condition} LIMIT 1", (url,)).fetchone()
+        return row is not None
+
+    def append(self, url, payload, headers, route=None):
+        # Returns the number of older batches evicted to make room
+        with self.lock:
+            dropped = self.make_room(len(payload))
+
+            path = self.segment_path(self.active)
+            with open(path, "ab") as segment:
+                offset = segment.tell()
+                segment.write(payload)
+                segment.flush()
+                os.fsync(segment.fileno())
+            self.total_bytes += len(payload)
+
+            self.conn.execute(
+                "INSERT INTO batches (segment, offset, length, url, headers, route, spooled_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.active, offset, len(payload), url, json.dumps(headers), route, time.time()))
+            self.conn.commit()
+
+            if offset + len(payload) >= self.segment_bytes:
+                self.active += 1
+        return dropped
+
+    def make_room(self, size):
+        if size > self.max_bytes:
+            raise SpoolFullError(f"A batch of {size} bytes is larger than the spool.")
+        dropped = 0
+        while self.total_bytes + size > self.max_bytes:
+            if self.eviction == "reject":
+                raise SpoolFullError(f"Spool is full ({self.total_bytes} bytes).")
+            oldest = self.conn.execute("SELECT MIN(segment) FROM batches").fetchone()[0]
+            if oldest is None:
+                oldest = self.active
+            if oldest == self.active:
+                self.active += 1  # a new segment is started so the current one can go
+            dropped += self.conn.execute("DELETE FROM batches WHERE segment = ?", (oldest,)).rowcount
+            self.conn.commit()
+            self.remove_segment(oldest)
+        return dropped
+
+    def peek(self, limit=1):
+        # Oldest batches due to be sent first, as (id, url, payload, headers, route)
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, segment, offset, length, url, headers, route FROM batches "
+                "WHERE next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (time.time(), limit)).fetchall()
+            batches = []
+            for batch_id, segment, offset, length, url, headers, route in rows:
+                with open(self.segment_path(segment), "rb") as file:
+                    file.seek(offset)
+                    payload = file.read(length)
+                batches.append((batch_id, url, payload, json.loads(headers), route))
+        return batches
+
+    def retry_later(self, batch_id):
+        # Counts a failed attempt and holds the batch back; returns its attempts so far
+        with self.lock:
+            row = self.conn.execute("SELECT attempts FROM batches WHERE id = ?", (batch_id,)).fetchone()
+            if row is None:
+                return 0
+            attempts = row[0] + 1
+            delay = min(SPOOL_RETRY_BACKOFF_MAX, self.retry_backoff * 2 ** (attempts - 1))
+            self.conn.execute("UPDATE batches SET attempts = ?, next_attempt_at = ? WHERE id = ?",
+                              (attempts, time.time() + delay, batch_id))
+            self.conn.commit()
+        return attempts
+
+    def dead_letter(self, batch_id, url, payload, headers, reason):
+        # Moves a batch out of the queue to dead_letter/batch_<id>.bin, with its URL, headers
+        # and the reason in batch_<id>.json, to be looked at (and re-sent) by hand
+        directory = os.path.join(self.directory, DEAD_LETTER_DIR)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"batch_{batch_id}")
+        with open(path + ".bin", "wb") as file:
+            file.write(payload)
+        with open(path + ".json", "w", encoding="utf-8") as file:
+            json.dump({"url": url, "headers": headers, "reason": reason, "failed_at": time.time()}, file)
+        self.remove(batch_id)
+        return path + ".bin"
+
+    def remove(self, batch_id):
+        with self.lock:
+            row = self.conn.execute("SELECT segment FROM batches WHERE id = ?", (batch_id,)).fetchone()
+            if row is None:
+                return
+            self.conn.execute("DELETE FROM batches WHERE id = ?", (batch_id,))
+            self.conn.commit()
+            segment = row[0]
+            if self.conn.execute("SELECT 1 FROM batches WHERE segment = ? LIMIT 1", (segment,)).fetchone() is None:
+                self.remove_segment(segment)  # the active segment is simply started again
+
+    def remove_segment(self, segment):
+        path = self.segment_path(segment)
+        try:
+            self.total_bytes -= os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,113 @@
+import os
+import csv
+import time
+import tempfile
+import unittest
+
+import transfer_engine
+from csv_parser import (
+    MMAP_CHUNK_BYTES, SplitRecordError, clean_rows, iter_mapped_rows, parse_byte_range, unpack_rows,
+)
+
+
+class MappedReaderTest(unittest.TestCase):
+    """iter_mapped_rows must give the rows and final offset the csv module gives."""
+
+    CASES = {
+        "crlf": b'a,b\r\n 1 , 2 ,3\r\n\r\n,,\r\nx\x00,y \r\n',
+        "bare_cr": b'a\r1,2\r3,4\n5,6',
+        "quoted": b'1,"a,b",3\n2,"multi\nline",4\n5,"q""x",6\n' * 50,
+        "nul": b'\x00 1,2\x00 ,\x00\n \x00 \n7,8\n',
+        "unicode": ' x ,Zürich ,  São\n　,　\n'.encode(),
+        "no_final_newline": b'1,2,3\n4,5,6',
+        "wide": b'1,2,3,4,5,6,7,8,9,10,11\n,,,,,,,,,x\n',
+        "stray_quote": b'1,pipe,x\n7,12" pipe,1\n8,a,b\n' * 20,
+        "open_quote": b'1,a\n2,"b,c\n3,d\n',
+    }
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".csv")
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write(self, data):
+        with open(self.path, "wb") as file:
+            file.write(data)
+        return len(data)
+
+    def expected(self, width):
+        with open(self.path, encoding="utf-8", newline="") as file:
+            return list(clean_rows(csv.reader(file), width))
+
+    def read(self, limit, width, chunk_bytes=MMAP_CHUNK_BYTES):
+        cursor = {"offset": 0}
+        with open(self.path, "rb") as file:
+            rows = list(iter_mapped_rows(file, cursor, limit, width, chunk_bytes))
+        return rows, cursor["offset"]
+
+    def test_same_rows_as_csv_module(self):
+        for name, data in self.CASES.items():
+            size = self.write(data)
+            for width in (1, 3, 8):
+                for chunk_bytes in (1, 7, 64, MMAP_CHUNK_BYTES):
+                    with self.subTest(name=name, width=width, chunk_bytes=chunk_bytes):
+                        self.assertEqual(self.read(size, width, chunk_bytes), (self.expected(width), size))
+
+    def test_stray_quote_in_large_file(self):
+        # A quote inside an unquoted field is text to the csv module; it must not make the
+        # reader take the rest of the file one line at a time
+        lines = "".join(f"{i},pipe {i},x,y\n" for i in range(100000))
+        size = self.write((lines[:1000] + '7,12" pipe,1\n' + lines[1000:]).encode())
+        self.assertGreater(size, MMAP_CHUNK_BYTES)
+        started = time.perf_counter()
+        rows, offset = self.read(size, 8)
+        self.assertLess(time.perf_counter() - started, 5)
+        self.assertEqual((rows, offset), (self.expected(8), size))
+
+    def test_parse_byte_range(self):
+        size = self.write(self.CASES["quoted"] + self.CASES["stray_quote"])
+        self.assertEqual(unpack_rows(parse_byte_range(self.path, 0, size, 3)), self.expected(3))
+
+    def test_range_ending_inside_quotes(self):
+        self.write(b'1,"line a\nline b",x\n2,y,z\n')
+        with self.assertRaises(SplitRecordError):
+            parse_byte_range(self.path, 0, 11, 3)  # ends after "line a\n"
+        self.assertEqual(unpack_rows(parse_byte_range(self.path, 20, 27, 3)), [["2", "y", "z"]])
+
+
+class ParallelReaderTest(unittest.TestCase):
+    """Chunks parsed by worker processes give the csv module's rows, even when a quoted
+    line break falls on a chunk boundary."""
+
+    def test_quoted_line_breaks(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "f.csv")
+            with open(path, "w", encoding="utf-8", newline="") as file:
+                file.write("a,b,c\n")
+                for number in range(2000):
+                    # Every record holds a line break, so chunk boundaries fall inside quotes
+                    file.write(f'{number},"line a\nline b",x\n')
+
+            config = transfer_engine.load_config()
+            config.update(log_dir=os.path.join(directory, "logs"), ledger_path=os.path.join(directory, "ledger.db"),
+                          spool_dir=None, parse_processes=2, parse_min_file_bytes=1, parse_chunk_bytes=1000)
+            engine = transfer_engine.TransferEngine(config)
+            try:
+                cursor = {"offset": 0}
+                rows = list(engine.iter_csv_rows(path, cursor, width=3))
+            finally:
+                engine.close()
+                if engine.parse_pool is not None:
+                    engine.parse_pool.shutdown()
+
+            with open(path, encoding="utf-8", newline="") as file:
+                reader = csv.reader(file)
+                next(reader)
+                self.assertEqual(rows, list(clean_rows(reader, 3)))
+            self.assertEqual(cursor["offset"], os.path.getsize(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import directory_watcher
+from directory_watcher import PollingDirectoryWatcher, create_directory_watcher
+
+
+class WatcherFallbackTest(unittest.TestCase):
+    """When inotify cannot be used, "auto" polls and hands the reason to the caller."""
+
+    def test_fallback_reason(self):
+        failing = mock.Mock(side_effect=OSError(24, "Too many open files"))
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(directory_watcher, "InotifyDirectoryWatcher", failing), \
+                mock.patch.object(sys, "platform", "linux"):
+            watcher, fallback = create_directory_watcher(directory, "auto")
+            watcher.close()
+        self.assertIsInstance(watcher, PollingDirectoryWatcher)
+        self.assertIn("Too many open files", fallback)
+
+    def test_explicit_backend(self):
+        with tempfile.TemporaryDirectory() as directory:
+            watcher, fallback = create_directory_watcher(directory, "poll")
+            watcher.close()
+        self.assertIsInstance(watcher, PollingDirectoryWatcher)
+        self.assertIsNone(fallback)
+
+
+if __name__ == "__main__":
+    unittest.main()
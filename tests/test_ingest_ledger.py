@@ -0,0 +1,99 @@
+import os
+import time
+import tempfile
+import unittest
+
+from ingest_ledger import IngestLedger
+
+
+class TailLedgerTest(unittest.TestCase):
+    """Tail mode: every appended byte is eventually queued from the checkpoint."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "f.csv")
+        self.ledger = IngestLedger(os.path.join(self.directory.name, "ledger.db"))
+
+    def tearDown(self):
+        self.ledger.conn.close()
+        self.directory.cleanup()
+
+    def append(self, data):
+        with open(self.path, "ab") as file:
+            file.write(data)
+
+    def state(self):
+        return self.ledger.conn.execute("SELECT state, size, byte_offset FROM files").fetchone()
+
+    def test_append_during_send(self):
+        self.append(b"h\n1,2\n")
+        self.assertTrue(self.ledger.enqueue(self.path, tail=True))
+        file_id, _, _, byte_offset = self.ledger.next_pending()
+        self.assertEqual(byte_offset, 0)
+
+        # The scan sees the file grow while the send is still running
+        self.append(b"3,4\n")
+        self.assertTrue(self.ledger.enqueue(self.path, tail=True))
+        self.ledger.finish(file_id, "sent", byte_offset=6, rows=1)
+
+        self.assertEqual(self.state(), ("pending", 10, 6))
+        file_id, _, _, byte_offset = self.ledger.next_pending()
+        self.assertEqual(byte_offset, 6)
+        self.ledger.finish(file_id, "sent", byte_offset=10, rows=1)
+        self.assertEqual(self.state(), ("sent", 10, 10))
+
+    def test_append_after_send(self):
+        self.append(b"h\n1,2\n")
+        self.ledger.enqueue(self.path, tail=True)
+        file_id = self.ledger.next_pending()[0]
+        self.ledger.finish(file_id, "sent", byte_offset=6, rows=1)
+        self.assertEqual(self.state(), ("sent", 6, 6))
+
+        self.append(b"3,4\n")
+        self.assertTrue(self.ledger.enqueue(self.path, tail=True))
+        self.assertEqual(self.state(), ("pending", 10, 6))
+
+
+class RetryBackoffTest(unittest.TestCase):
+    """A file that failed to send is retried after a growing wait, holding up its route."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.ledger = IngestLedger(os.path.join(self.directory.name, "ledger.db"), retry_backoff=0.2)
+        for name in ("a.csv", "b.csv"):
+            path = os.path.join(self.directory.name, name)
+            with open(path, "w") as file:
+                file.write(f"h\n{name}\n")
+            self.ledger.enqueue(path)
+
+    def tearDown(self):
+        self.ledger.close()
+        self.directory.cleanup()
+
+    def test_backoff(self):
+        file_id, path, attempts, _ = self.ledger.next_pending()
+        self.assertEqual((os.path.basename(path), attempts), ("a.csv", 0))
+        self.ledger.finish(file_id, "pending", "API down")
+
+        # Neither the failed file nor the one queued behind it is handed out before the wait
+        self.assertIsNone(self.ledger.next_pending())
+        self.assertEqual(self.ledger.pending_routes(), set())
+        time.sleep(0.25)
+        self.assertEqual(self.ledger.next_pending()[:3], (file_id, path, 1))
+
+        # The second failure waits twice as long
+        self.ledger.finish(file_id, "pending", "API down")
+        time.sleep(0.25)
+        self.assertIsNone(self.ledger.next_pending())
+        time.sleep(0.2)
+        self.assertEqual(self.ledger.next_pending()[2], 2)
+
+    def test_uncounted_finish(self):
+        # A stopped transfer (or a full spool) neither uses up an attempt nor delays the file
+        file_id = self.ledger.next_pending()[0]
+        self.ledger.finish(file_id, "pending", "stopped", count_attempt=False)
+        self.assertEqual(self.ledger.next_pending()[::2], (file_id, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
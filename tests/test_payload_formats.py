@@ -0,0 +1,79 @@
+import gzip
+import json
+import threading
+import unittest
+import importlib.util
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from api_client import ApiTransport, PayloadEncoder, msgpack, zstandard
+
+RECORDS = [
+    {"column_1": "1", "column_2": "Zürich, \"quoted\"", "column_3": ""},
+    {"column_1": "2", "column_2": "line\nbreak", "column_3": "x" * 1000},
+]
+
+
+def decode_body(body, content_type, content_encoding):
+    if content_encoding == "gzip":
+        body = gzip.decompress(body)
+    elif content_encoding == "zstd":
+        body = zstandard.ZstdDecompressor().decompress(body)
+    if content_type == "application/json":
+        return json.loads(body)
+    if content_type == "application/x-ndjson":
+        return [json.loads(line) for line in body.splitlines()]
+    if content_type == "application/msgpack":
+        return msgpack.unpackb(body, raw=False)
+    import pyarrow
+
+    return pyarrow.ipc.open_stream(body).read_all().to_pylist()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Decodes each batch as a real API would and keeps the records
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.received.append(
+            decode_body(body, self.headers["Content-Type"], self.headers.get("Content-Encoding")))
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class PayloadRoundTripTest(unittest.TestCase):
+    """Every format and compression posted to a local stand-in API decodes to the same records."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        cls.server.received = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/api"
+        cls.transport = ApiTransport(max_retries=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.transport.close()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_round_trip(self):
+        packages = {"msgpack": msgpack, "arrow": importlib.util.find_spec("pyarrow"), "zstd": zstandard}
+        for data_format in ("json", "ndjson", "msgpack", "arrow"):
+            for compression in (None, "gzip", "zstd"):
+                with self.subTest(format=data_format, compression=compression):
+                    missing = [name for name in (data_format, compression) if name in packages and not packages[name]]
+                    if missing:
+                        self.skipTest(f"{missing[0]} needs a package that is not installed")
+                    encoder = PayloadEncoder({"format": data_format, "compression": compression})
+                    payload = encoder.compress(encoder.serialize(RECORDS))
+                    response = self.transport.post(self.url, data=payload, headers=encoder.headers)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(self.server.received.pop(), RECORDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
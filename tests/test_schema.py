@@ -0,0 +1,32 @@
+import json
+import unittest
+
+from schema import Schema
+
+
+class NumericColumnTest(unittest.TestCase):
+    """Numbers the API could not read, or that are not valid JSON, are rejected row by row."""
+
+    def setUp(self):
+        self.schema = Schema.from_config([{"name": "n", "type": "int"}, {"name": "x", "type": "float"}])
+
+    def convert(self, rows):
+        return self.schema.convert(rows, self.schema.bind())
+
+    def test_valid(self):
+        records, rejected = self.convert([["1", "1.5"], ["-20", "+.5e3"], ["+3", "7"]])
+        self.assertEqual(records, [{"n": 1, "x": 1.5}, {"n": -20, "x": 500.0}, {"n": 3, "x": 7.0}])
+        self.assertEqual(rejected, [])
+
+    def test_rejected(self):
+        bad_ints = ["1_000", "٣", "1.0", " 1"]
+        bad_floats = ["nan", "inf", "-Infinity", "1e999", "1_0.5", "٣.5"]
+        rows = [[value, "1"] for value in bad_ints] + [["1", value] for value in bad_floats]
+        records, rejected = self.convert([["5", "2.5"]] + rows)
+        self.assertEqual(records, [{"n": 5, "x": 2.5}])
+        self.assertEqual([row for row, _ in rejected], rows)
+        json.dumps(records, allow_nan=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
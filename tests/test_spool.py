@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import transfer_engine
+from spool import DEAD_LETTER_DIR, BatchSpool
+
+
+class PoisonHandler(BaseHTTPRequestHandler):
+    # Accepts every batch but the one containing b"poison", which always gets a 500
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.posts.append(body)
+        self.send_response(500 if b"poison" in body else 200)
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class SpoolRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spool = BatchSpool(os.path.join(self.directory.name, "spool"), retry_backoff=60)
+
+    def tearDown(self):
+        self.spool.close()
+        self.directory.cleanup()
+
+    def test_failed_batch_waits_apart(self):
+        self.spool.append("u", b"first", {})
+        self.spool.append("u", b"second", {})
+        first = self.spool.peek()[0][0]
+        self.assertEqual(self.spool.retry_later(first), 1)
+
+        # The next batch goes ahead, and new batches no longer queue behind the failed one
+        self.assertEqual([batch[2] for batch in self.spool.peek(5)], [b"second"])
+        self.spool.remove(self.spool.peek()[0][0])
+        self.assertTrue(self.spool.has_batches("u"))
+        self.assertFalse(self.spool.has_batches("u", include_retried=False))
+
+    def test_dead_letter(self):
+        self.spool.append("u", b"payload", {"X-Batch-Sequence": "0"})
+        batch_id, url, payload, headers, _ = self.spool.peek()[0]
+        path = self.spool.dead_letter(batch_id, url, payload, headers, "rejected")
+        self.assertEqual(len(self.spool), 0)
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), b"payload")
+        with open(path[:-len(".bin")] + ".json", encoding="utf-8") as file:
+            self.assertEqual(json.load(file)["reason"], "rejected")
+
+
+class DrainPoisonBatchTest(unittest.TestCase):
+    """One batch the API always fails must not hold up the rest of the spool."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), PoisonHandler)
+        self.server.posts = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+        config = transfer_engine.load_config()
+        config.update(log_dir=os.path.join(self.directory.name, "logs"),
+                      ledger_path=os.path.join(self.directory.name, "ledger.db"),
+                      spool_dir=os.path.join(self.directory.name, "spool"),
+                      destination={"url": url + "api"}, network_check_url=url,
+                      http_max_retries=0, spool_drain_rate=0, spool_retry_backoff=0.2, spool_max_attempts=2)
+        self.engine = transfer_engine.TransferEngine(config)
+        self.url = url + "api"
+
+    def tearDown(self):
+        self.engine.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def test_poison_batch(self):
+        spool = self.engine.spool
+        for payload in (b"poison", b"good 1", b"good 2", b"good 3", b"good 4"):
+            spool.append(self.url, payload, {})
+        self.assertTrue(self.engine.check_network_connection())
+
+        self.engine.drain_spool()
+        self.assertEqual(self.server.posts[-4:], [b"good 1", b"good 2", b"good 3", b"good 4"])
+        self.assertEqual(len(spool), 1)
+
+        time.sleep(0.3)
+        self.engine.drain_spool()  # the second failure uses up spool_max_attempts
+        self.assertEqual(len(spool), 0)
+        self.assertEqual(self.server.posts.count(b"poison"), 2)
+        dead_letters = os.listdir(os.path.join(self.directory.name, "spool", DEAD_LETTER_DIR))
+        self.assertEqual(sorted(name.rsplit(".", 1)[1] for name in dead_letters), ["bin", "json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
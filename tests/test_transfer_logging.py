@@ -0,0 +1,32 @@
+import logging
+import unittest
+
+from transfer_logging import RepeatedMessageFilter
+
+
+class RepeatedMessageFilterTest(unittest.TestCase):
+    """Only status messages are deduplicated; the audit trail keeps every other record."""
+
+    def record(self, message, created, dedup=None):
+        record = logging.LogRecord("data_transfer", logging.INFO, __file__, 0, message, None, None)
+        record.created = created
+        if dedup is not None:
+            record.dedup = dedup
+        return record
+
+    def test_only_status_messages(self):
+        log_filter = RepeatedMessageFilter(window=60)
+        for second in range(3):
+            self.assertTrue(log_filter.filter(self.record("Sent 1 batch(es)", second)))
+            self.assertTrue(log_filter.filter(self.record("Rejected row", second, dedup=False)))
+
+        passed = [log_filter.filter(self.record("Network Status: Disconnected", second, dedup=True))
+                  for second in (0, 5, 10, 70)]
+        self.assertEqual(passed, [True, False, False, True])
+        record = self.record("Network Status: Disconnected", 140, dedup=True)
+        self.assertTrue(log_filter.filter(record))
+        self.assertEqual(record.getMessage(), "Network Status: Disconnected")
+
+
+if __name__ == "__main__":
+    unittest.main()
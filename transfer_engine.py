@@ -0,0 +1,959 @@
+"""CSV to REST API transfer pipeline, independent of any GUI.
+
+Run headless with:  python -m transfer_engine --config config.json
+"""
+import os
+import csv
+import json
+import copy
+import bisect
+import hashlib
+import time
+import signal
+import logging
+import argparse
+import itertools
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+import api_client
+import directory_watcher
+import health
+import ingest_ledger
+import metrics
+import rate_control
+import spool
+import transfer_logging
+from api_client import ApiTransport, BatchUploader, is_unreachable_error
+from csv_parser import (
+    ROW_WIDTH, SplitRecordError, clean_rows, iter_mapped_rows, last_line_end, parse_byte_range, split_byte_ranges,
+    unpack_rows,
+)
+from directory_watcher import create_directory_watcher
+from health import HealthMonitor
+from ingest_ledger import IngestLedger
+from metrics import Metrics, MetricsServer, profile_call
+from rate_control import AdaptiveController
+from routing import build_routes
+from schema import read_header
+from spool import BatchSpool, SpoolFullError
+from transfer_logging import setup_logging
+
+# Every setting can be overridden by the JSON config file passed to load_config
+DEFAULT_CONFIG = {
+    "source_directory": None,           # directory to watch (the GUI lets the user pick one)
+    "log_dir": "logs",
+    "log_retention_days": 7,
+    "log_retention_interval": 60 * 60,  # seconds between clean-ups of the log directory
+    "log_max_bytes": transfer_logging.LOG_MAX_BYTES,
+    "log_dedup_seconds": transfer_logging.LOG_DEDUP_SECONDS,
+    "log_pretty_json": False,           # indent JSON written to the log (never affects what is sent)
+    "log_payload_sample_every": 100,    # log the payload of every Nth batch (0 = never)
+    "log_payload_max_chars": 2000,      # logged payloads are cut to this length
+    "ledger_path": ingest_ledger.LEDGER_PATH,
+    "backfill_existing_files": False,   # on a new directory, only the newest existing file is sent
+    # A file is tried up to max_file_attempts times when the network fails, file_retry_backoff
+    # seconds apart and doubling each time; the files queued behind it on its route wait too
+    "max_file_attempts": 3,
+    "file_retry_backoff": ingest_ledger.FILE_RETRY_BACKOFF,
+    "poll_interval": 1.0,               # seconds between directory scans
+    # The network status comes from the uploads' own answers; network_check_url is only probed
+    # after network_check_idle_seconds without answers, after a failed request, or while down
+    # (backing off from network_check_backoff_min to network_check_backoff_max between probes)
+    "network_check_interval": 5.0,      # seconds between looks at whether a probe is due
+    "network_check_url": api_client.NETWORK_CHECK_URL,
+    "network_check_method": health.HEALTH_PROBE_METHOD,
+    "network_check_timeout": api_client.NETWORK_CHECK_TIMEOUT,
+    "network_check_idle_seconds": health.HEALTH_IDLE_SECONDS,
+    "network_check_backoff_min": health.HEALTH_BACKOFF_MIN,
+    "network_check_backoff_max": health.HEALTH_BACKOFF_MAX,
+    "destination": dict(api_client.API_DESTINATION),
+    # Routing table: each entry maps a directory (glob allowed) to its own destinations, e.g.
+    #   {"name": "line1", "directory": "/data/line1*", "pattern": "*.csv",
+    #    "destinations": [{"url": "https://a/api"}, {"url": "https://b/api", "format": "ndjson"}],
+    #    "max_in_flight": 2, "batch_max_rows": 1000}
+    # Missing settings come from the top-level ones; source_directory adds a "default" route
+    "routes": [],
+    "api_timeout": list(api_client.API_TIMEOUT),    # [connect, read] seconds
+    "http_max_retries": api_client.HTTP_MAX_RETRIES,
+    "http_pool_maxsize": api_client.HTTP_POOL_MAXSIZE,
+    "upload_max_in_flight": api_client.UPLOAD_MAX_IN_FLIGHT,
+    "upload_preserve_order": api_client.UPLOAD_PRESERVE_ORDER,
+    # Uploads adapt to how the API copes (AIMD): 429/5xx answers, connection errors and responses
+    # slower than the latency target halve a destination's window of requests in flight (and its
+    # batch size), fast answers grow them back step by step. max_in_flight, batch_max_rows and
+    # batch_max_bytes are the ceilings; a destination's "rate_limit" caps its requests per second.
+    "adaptive_latency_target": rate_control.ADAPTIVE_LATENCY_TARGET,    # seconds (0 = latency is ignored)
+    "adaptive_min_in_flight": rate_control.ADAPTIVE_MIN_IN_FLIGHT,
+    # Smallest batch as a fraction of the configured size (1.0 = fixed size). Smaller batches
+    # change the batch keys, so a file retried after a failure may resend accepted rows.
+    "adaptive_batch_min_fraction": rate_control.ADAPTIVE_BATCH_MIN_FRACTION,
+    # Each batch gets a key from the file, its byte range and its content; batches an API
+    # already accepted are skipped when a file is sent again
+    "idempotency_header": api_client.IDEMPOTENCY_HEADER,   # None = do not send the key
+    "acked_cache_size": ingest_ledger.ACKED_CACHE_SIZE,
+    "acked_retention_days": 30,
+    "batch_max_rows": 5000,             # 0 = no row limit
+    "batch_max_bytes": 4 * 1024 * 1024, # 0 = no size limit (approximate JSON size)
+    "worker_threads": 2,
+    "parse_processes": 0,               # processes parsing large files in parallel (0 = parse in the sending thread)
+    "parse_chunk_bytes": 8 * 1024 * 1024,       # large files are split into chunks of about this size
+    "parse_min_file_bytes": 64 * 1024 * 1024,   # smaller files (or unsent parts) are parsed in one pass
+    "mmap_min_file_bytes": 4 * 1024 * 1024,     # larger files are read through mmap (0 = never; not in tail mode)
+    "max_pending_jobs": 4,              # ticks are dropped while this many jobs are queued
+    "watch_backend": directory_watcher.WATCH_BACKEND,
+    "tail_mode": False,                 # follow growing files and send only appended complete lines
+    "tail_active_seconds": directory_watcher.TAIL_ACTIVE_SECONDS,
+    # Columns sent for each CSV row (None = 8 string columns named column_1..column_8), e.g.
+    #   [{"name": "line", "source": "Line ID", "required": true},
+    #    {"name": "count", "type": "int", "nullable": false, "source": 3},
+    #    {"name": "at", "type": "datetime", "format": "%d/%m/%Y %H:%M:%S"}]
+    # Types: string, int, float, bool, date, datetime. Rows that do not fit are rejected one by one.
+    "schema": None,
+    "log_rejected_rows": 10,            # rejected rows logged per file (the rest are only counted)
+    # Batches the API cannot take (unreachable, timeouts, 429/5xx after retries) are kept on disk
+    # and sent once the network check reports connected again (None = no spool)
+    "spool_dir": "spool",
+    "spool_max_bytes": spool.SPOOL_MAX_BYTES,
+    "spool_segment_bytes": spool.SPOOL_SEGMENT_BYTES,
+    "spool_eviction": spool.SPOOL_EVICTION,
+    "spool_drain_rate": 10.0,           # spooled batches sent per second (0 = no limit)
+    # A spooled batch the API answers with a 5xx (or a read timeout) is retried after spool_retry_backoff
+    # seconds, doubling, while the batches behind it go ahead; after spool_max_attempts, or when the API
+    # rejects it (4xx), it is moved to <spool_dir>/dead_letter
+    "spool_retry_backoff": spool.SPOOL_RETRY_BACKOFF,
+    "spool_max_attempts": spool.SPOOL_MAX_ATTEMPTS,
+    # Counters and latency histograms in the Prometheus text format at http://<host>:<port>/metrics
+    "metrics_port": 0,                  # 0 = no endpoint (the GUI statistics still work)
+    "metrics_host": metrics.METRICS_HOST,
+}
+
+
+def load_config(path=None):
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    if path:
+        with open(path, encoding="utf-8") as file:
+            overrides = json.load(file)
+
+        unknown = set(overrides) - set(config)
+        if unknown:
+            raise ValueError(f"Unknown setting(s) in {path}: {', '.join(sorted(unknown))}")
+
+        for key, value in overrides.items():
+            if isinstance(config[key], dict) and isinstance(value, dict):
+                config[key].update(value)
+            else:
+                config[key] = value
+    return config
+
+
+class TransferEngine:
+    """Watches the routed directories and posts every new CSV file to its route's API endpoints.
+
+    Work runs on a small thread pool; tick() and check_network() only queue
+    jobs, so they can be driven by Qt timers or by run_forever(). Each route
+    is sent by its own job, and all routes share the watchers, the HTTP
+    connection pool and the upload threads. Progress is
+    reported through the optional on_status, on_latest_file and
+    on_network_status callbacks, which are called from worker threads.
+    """
+
+    def __init__(self, config=None, on_status=None, on_latest_file=None, on_network_status=None):
+        self.config = config or load_config()
+        self.on_status = on_status
+        self.on_latest_file = on_latest_file
+        self.on_network_status = on_network_status
+
+        self.log_dir = self.config["log_dir"]
+        os.makedirs(self.log_dir, exist_ok=True)
+        self.logger, self.log_listener = setup_logging(
+            self.log_dir, self.config["log_max_bytes"], self.config["log_dedup_seconds"])
+
+        self.routes = []
+        self.controllers = {}   # destination URL -> AdaptiveController
+        self.running = False
+        self.latest_csv_file = None
+        self.latest_json_data = None
+        self.payload_counter = itertools.count()
+        self.profile_requested = threading.Event()
+        self.metrics = self.create_metrics()
+        self.ledger = IngestLedger(self.config["ledger_path"], self.config["acked_cache_size"],
+                                   self.config["file_retry_backoff"])
+        self.ledger.prune_acked(time.time() - self.config["acked_retention_days"] * 24 * 60 * 60)
+
+        # Pools are sized for every configured route plus the default one
+        route_count = len(self.config["routes"]) + 1
+        upload_workers = self.config["upload_max_in_flight"] + sum(
+            route.get("max_in_flight", self.config["upload_max_in_flight"]) for route in self.config["routes"])
+        self.max_pending_jobs = max(self.config["max_pending_jobs"], route_count + 4)
+
+        self.executor = ThreadPoolExecutor(max_workers=max(self.config["worker_threads"], route_count + 2),
+                                           thread_name_prefix="transfer")
+        self.upload_executor = ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix="upload")
+        self.pending_jobs = set()
+        self.jobs_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.watchers = {}  # one per directory, shared by the routes watching it
+        self.parse_pool = None  # started on the first large file
+        self.parse_pool_lock = threading.Lock()
+        self.health = HealthMonitor(self.config["network_check_url"], self.config["network_check_method"],
+                                    self.config["network_check_timeout"], self.config["network_check_idle_seconds"],
+                                    self.config["network_check_backoff_min"], self.config["network_check_backoff_max"],
+                                    on_change=self.report_network_status)
+        self.transport = ApiTransport(stop_event=self.stop_event,
+                                      timeout=self.config["api_timeout"],
+                                      max_retries=self.config["http_max_retries"],
+                                      pool_maxsize=max(self.config["http_pool_maxsize"], upload_workers),
+                                      metrics=self.metrics, health=self.health)
+        self.spool = None
+        self.spool_blocked = set()  # routes waiting for the full spool to drain
+        if self.config["spool_dir"]:
+            self.spool = BatchSpool(self.config["spool_dir"], self.config["spool_max_bytes"],
+                                    self.config["spool_segment_bytes"], self.config["spool_eviction"],
+                                    self.config["spool_retry_backoff"])
+            self.metrics.gauge("spool_batches", lambda: len(self.spool))
+        self.metrics.gauge("pending_jobs", lambda: len(self.pending_jobs))
+        self.metrics.gauge("upload_window", lambda: sum(
+            controller.in_flight_limit for controller in list(self.controllers.values())))
+        self.metrics_server = None
+        if self.config["metrics_port"]:
+            self.metrics_server = MetricsServer(self.metrics, self.config["metrics_port"], self.config["metrics_host"])
+
+        self.next_log_retention = 0
+        self.generate_log_file()
+        self.enforce_log_retention()
+
+    def create_metrics(self):
+        registry = Metrics()
+        registry.describe("ingest_stage_seconds", "Time spent per batch in each stage (scan is per directory scan)")
+        registry.describe("http_request_seconds", "Duration of each HTTP request attempt")
+        registry.describe("http_requests_total", "HTTP request attempts by status code or error")
+        registry.describe("ingest_rows_total", "CSV rows read and converted")
+        registry.describe("ingest_rows_rejected_total", "CSV rows that did not match the schema")
+        registry.describe("ingest_bytes_read_total", "CSV bytes read")
+        registry.describe("ingest_payload_bytes_total", "Encoded payload bytes handed to the uploader")
+        registry.describe("ingest_batches_total", "Batches by result (sent, skipped or spooled)")
+        registry.describe("ingest_files_total", "Files processed by ledger state")
+        return registry
+
+    def notify_status(self, message):
+        if self.on_status is not None:
+            self.on_status(message)
+
+    def notify_latest_file(self, message):
+        if self.on_latest_file is not None:
+            self.on_latest_file(message)
+
+    def start(self, directory=None):
+        # directory (e.g. the one picked in the GUI) replaces source_directory for the default route
+        routes = build_routes(self.config, directory)
+        if not routes:
+            raise ValueError("No directory selected")
+        for route in routes:
+            route.uploader = BatchUploader(self.transport, route.max_in_flight, executor=self.upload_executor,
+                                           key_header=self.config["idempotency_header"])
+
+        self.controllers = self.create_controllers(routes)
+        self.routes = routes
+        self.stop_event.clear()
+        self.running = True
+        for route in routes:
+            urls = ", ".join(destination["url"] for destination in route.destinations)
+            self.write_to_log(f"Data transfer started for route {route.name}: "
+                              f"{os.pathsep.join(route.directories)} ({route.pattern}) -> {urls}")
+
+    def create_controllers(self, routes):
+        # One controller per destination URL, shared by the routes posting to it; its
+        # window may grow to the largest max_in_flight among them
+        ceilings = {}
+        rates = {}
+        for route in routes:
+            for destination in route.destinations:
+                url = destination["url"]
+                ceilings[url] = max(ceilings.get(url, 0), route.max_in_flight)
+                rates[url] = destination.get("rate_limit") or rates.get(url, 0)
+        return {url: AdaptiveController(ceiling, self.config["adaptive_min_in_flight"],
+                                        self.config["adaptive_batch_min_fraction"],
+                                        self.config["adaptive_latency_target"], rates[url])
+                for url, ceiling in ceilings.items()}
+
+    def rate_status(self):
+        # Current upload settings, e.g. "2/4 in flight, max 10/s" (per host with several destinations)
+        controllers = list(self.controllers.items())
+        if len(controllers) == 1:
+            return controllers[0][1].describe()
+        return "; ".join(f"{urlsplit(url).netloc}{urlsplit(url).path}: {controller.describe()}" for url, controller in controllers)
+
+    def stop(self):
+        self.running = False
+        self.stop_event.set()
+        self.write_to_log("Data transfer stopped")
+
+    def tick(self):
+        if self.running and self.routes:
+            self.submit_job("scan", self.scan_directories, self.routes)
+            if self.spool is not None and self.connected and self.spool.has_batches():
+                self.submit_job("drain", self.drain_spool)
+
+    @property
+    def connected(self):
+        # Last known network status (None until known); never sends a request
+        return self.health.connected
+
+    def check_network(self):
+        # Cheap enough to call every few seconds: a probe is only queued when one is due
+        if self.health.probe_due():
+            self.submit_job("network_check", self.check_network_connection)
+
+    def enforce_log_retention(self):
+        # May be called often (the GUI does every minute); old logs are only looked for
+        # every log_retention_interval, by a background job
+        now = time.monotonic()
+        if now >= self.next_log_retention and self.submit_job("log_retention", self.cleanup_old_files, self.log_dir):
+            self.next_log_retention = now + self.config["log_retention_interval"]
+
+    def profile_next_file(self):
+        # The next file sent is run under cProfile and tracemalloc (see profile_call)
+        self.profile_requested.set()
+        self.write_to_log("The next file will be profiled")
+
+    def run_forever(self, shutdown_event):
+        # Headless scheduler: the same ticks the GUI timers produce
+        next_check = 0
+        while not shutdown_event.is_set():
+            now = time.monotonic()
+            if now >= next_check:
+                self.check_network()
+                next_check = now + self.config["network_check_interval"]
+            self.tick()
+            self.enforce_log_retention()
+            shutdown_event.wait(self.config["poll_interval"])
+
+    def close(self, wait=True):
+        # wait=False returns at once and leaves a running job to notice stop_event
+        self.running = False
+        self.stop_event.set()
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+        self.upload_executor.shutdown(wait=False, cancel_futures=True)
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(wait=False, cancel_futures=True)
+        for watcher in self.watchers.values():
+            watcher.close()
+        self.ledger.close()
+        if self.spool is not None:
+            self.spool.close()
+        self.transport.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        self.log_listener.stop()
+
+    def submit_job(self, name, fn, *args):
+        # Only one job per name may be queued or running, and the queue is bounded,
+        # so ticks that fire while the API is slow are simply skipped
+        with self.jobs_lock:
+            if name in self.pending_jobs or len(self.pending_jobs) >= self.max_pending_jobs:
+                return False
+            self.pending_jobs.add(name)
+
+        try:
+            future = self.executor.submit(fn, *args)
+        except RuntimeError:  # the engine is shutting down
+            with self.jobs_lock:
+                self.pending_jobs.discard(name)
+            return False
+        future.add_done_callback(lambda f: self.job_finished(name, f))
+        return True
+
+    def job_finished(self, name, future):
+        with self.jobs_lock:
+            self.pending_jobs.discard(name)
+
+        if not future.cancelled() and future.exception():
+            error_msg = f"Background job '{name}' failed: {future.exception()}"
+            self.notify_status(error_msg)
+            self.write_to_log(error_msg, logging.ERROR)
+
+    def check_network_connection(self):
+        # Probes the API now; the status change, if any, is reported by report_network_status
+        return self.health.probe(self.transport)
+
+    def report_network_status(self, connected):
+        if self.on_network_status is not None:
+            self.on_network_status(connected)
+        if connected:
+            self.write_to_log("Network Status: Connected", dedup=True)
+        else:
+            self.write_to_log("Network Status: Disconnected", logging.WARNING, dedup=True)
+
+    def scan_directories(self, routes):
+        with self.metrics.time("ingest_stage_seconds", stage="scan"):
+            self.scan_routed_directories(routes)
+
+    def scan_routed_directories(self, routes):
+        directories = dict.fromkeys(directory for route in routes for directory in route.directories)
+        for directory in set(self.watchers) - set(directories):
+            self.watchers.pop(directory).close()  # no longer routed after a restart
+        for directory in directories:
+            self.load_new_csv_files(directory, routes)
+
+        # Each route with queued files is sent by its own job, so a slow endpoint
+        # does not hold up the other routes
+        pending = self.ledger.pending_routes()
+        for route in routes:
+            if route.name in pending:
+                self.submit_job(f"route:{route.name}", self.process_pending_files, route)
+
+        with self.jobs_lock:
+            sending = any(name.startswith("route:") for name in self.pending_jobs)
+        if not sending:
+            self.notify_latest_file("No new CSV file found.")
+
+    def poll_directory_events(self, directory):
+        # Watchers are only touched from the single "scan" job, so no locking is needed
+        watcher = self.watchers.get(directory)
+        if watcher is None:
+            active_seconds = self.config["tail_active_seconds"] if self.config["tail_mode"] else 0
+            watcher, fallback = create_directory_watcher(directory, self.config["watch_backend"], active_seconds)
+            if fallback:
+                self.write_to_log(f"Polling {directory} for new files: {fallback}", logging.WARNING)
+            self.watchers[directory] = watcher
+            return watcher.start()
+        return watcher.poll()
+
+    def load_new_csv_files(self, directory, routes):
+        first_scan = directory not in self.watchers
+        events = self.poll_directory_events(directory)
+        tail_mode = self.config["tail_mode"]
+
+        # Only files reported by the watcher are stat'ed here; each file goes to the
+        # first route that matches it
+        routed = {}
+        ready = ("closed", "modified") if tail_mode else ("closed",)
+        for event in events:
+            if event.kind not in ready:
+                continue
+            route = next((route for route in routes if route.matches(event.path)), None)
+            if route is None:
+                continue
+            try:
+                routed.setdefault(route.name, []).append((os.path.getmtime(event.path), event.path))
+            except OSError:
+                continue
+
+        skip_existing = (first_scan and not self.config["backfill_existing_files"]
+                         and not self.ledger.has_files_in(directory))
+        for route_name, csv_files in routed.items():
+            csv_files = [path for _, path in sorted(csv_files)]
+
+            if skip_existing:
+                # First time this directory is used: record the existing files without
+                # sending them, apart from the newest one of each route
+                for file_path in csv_files[:-1]:
+                    self.ledger.enqueue(file_path, state="skipped", route=route_name)
+                csv_files = csv_files[-1:]
+
+            for file_path in csv_files:
+                try:
+                    if self.ledger.enqueue(file_path, tail=tail_mode, route=route_name):
+                        self.write_to_log(f"Queued CSV File: {os.path.basename(file_path)} ({route_name})")
+                except OSError as e:
+                    self.write_to_log(f"Unable to queue {file_path}: {e}", logging.WARNING)
+
+    def process_pending_files(self, route):
+        processed = 0
+        while not self.stop_event.is_set() and route.name not in self.spool_blocked:
+            entry = self.ledger.next_pending(route.name)
+            if entry is None:
+                break
+
+            file_id, file_path, attempts, byte_offset = entry
+            latest_file = os.path.basename(file_path)
+            self.latest_csv_file = file_path
+            self.notify_latest_file(f"Latest CSV File: {latest_file}")
+            self.write_to_log(f"Latest CSV File: {latest_file}" + (f" from byte {byte_offset}" if byte_offset else ""))
+
+            if self.profile_requested.is_set():
+                self.profile_requested.clear()
+                result = self.profile_file(file_path, route, byte_offset)
+            else:
+                result = self.load_csv(file_path, route, byte_offset)
+            state, end_offset, row_count, rejected_count, error = result
+            if state in ("deferred", "stopped"):
+                # The file stays pending without using up an attempt. A deferred file's route
+                # sends nothing more until drain_spool has made room; a stopped one is sent
+                # again when the transfer is started
+                if state == "deferred":
+                    self.spool_blocked.add(route.name)
+                self.ledger.finish(file_id, "pending", error, count_attempt=False)
+                self.metrics.inc("ingest_files_total", route=route.name, state=state)
+                break
+            if state == "pending" and attempts + 1 >= self.config["max_file_attempts"]:
+                state = "failed"
+            self.ledger.finish(file_id, state, error, end_offset, row_count, rejected_count)
+            self.metrics.inc("ingest_files_total", route=route.name, state=state)
+            processed += 1
+
+        return processed
+
+    def profile_file(self, file_path, route, byte_offset):
+        file_name = os.path.basename(file_path)
+        output_path = os.path.join(self.log_dir, f"profile_{time.strftime('%Y%m%d_%H%M%S')}_{file_name}.prof")
+        result, summary = profile_call(output_path, self.load_csv, file_path, route, byte_offset)
+        self.notify_status(f"Profile of {file_name} saved to {output_path}")
+        self.write_to_log(f"Profile of {file_name} saved to {output_path}\n{summary}")
+        return result
+
+    def iter_csv_rows(self, file_path, cursor, complete_lines_only=False, end_offset=None, width=ROW_WIDTH):
+        # cursor["offset"] is the byte position to start from and is advanced past every
+        # line the csv reader consumes; the header is only read when starting at 0.
+        # Reading stops at end_offset, if given.
+        with open(file_path, mode='rb') as file:
+            limit = os.fstat(file.fileno()).st_size
+            if end_offset is not None:
+                limit = min(limit, end_offset)
+            if self.config["parse_processes"] and limit - cursor["offset"] >= self.config["parse_min_file_bytes"]:
+                yield from self.iter_csv_rows_parallel(file, file_path, cursor, limit, complete_lines_only, width)
+                return
+            mmap_min_bytes = self.config["mmap_min_file_bytes"]
+            if mmap_min_bytes and not complete_lines_only and limit - cursor["offset"] >= mmap_min_bytes:
+                # Files still being written are not mapped: a truncated mapping would crash the process
+                if cursor["offset"] == 0:
+                    header = file.readline()
+                    if not header:
+                        raise ValueError("CSV file is empty or has no header.")
+                    cursor["offset"] = len(header)
+                yield from iter_mapped_rows(file, cursor, limit, width, stop=self.stop_event)
+                return
+
+            file.seek(cursor["offset"])
+
+            def lines():
+                for line in file:
+                    if end_offset is not None and cursor["offset"] >= end_offset:
+                        return
+                    if complete_lines_only and not line.endswith(b"\n"):
+                        return  # the producer is still writing this line
+                    cursor["offset"] += len(line)
+                    yield line.decode('utf-8')
+
+            csv_reader = csv.reader(lines())
+
+            # Read header
+            if cursor["offset"] == 0:
+                header = next(csv_reader, None)
+                if header is None:
+                    raise ValueError("CSV file is empty or has no header.")
+
+            yield from clean_rows(csv_reader, width)
+
+    def iter_csv_rows_parallel(self, file, file_path, cursor, limit, complete_lines_only, width):
+        # The file is cut into byte ranges at line boundaries, which worker processes
+        # parse while earlier chunks are sent; rows come back in file order. From a range
+        # that ends inside a quoted field on, the file is read in this process instead.
+        if cursor["offset"] == 0:
+            header = file.readline()
+            if not header:
+                raise ValueError("CSV file is empty or has no header.")
+            cursor["offset"] = len(header)
+        if complete_lines_only:
+            limit = last_line_end(file, limit)
+
+        pool = self.get_parse_pool()
+        ranges = deque(split_byte_ranges(file, cursor["offset"], limit, self.config["parse_chunk_bytes"]))
+        in_flight = deque()
+        try:
+            while ranges or in_flight:
+                # Only a few chunks are parsed ahead, so memory stays bounded
+                while ranges and len(in_flight) < 2 * self.config["parse_processes"]:
+                    start, end = ranges.popleft()
+                    in_flight.append((end, pool.submit(parse_byte_range, file_path, start, end, width)))
+
+                end, future = in_flight.popleft()
+                try:
+                    rows = future.result()
+                except SplitRecordError as e:
+                    self.write_to_log(f"{os.path.basename(file_path)}: {e} The rest of the file is read "
+                                      f"in one process.", logging.WARNING)
+                    yield from iter_mapped_rows(file, cursor, limit, width, stop=self.stop_event)
+                    return
+                yield from unpack_rows(rows)
+                cursor["offset"] = end
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+
+    def get_parse_pool(self):
+        with self.parse_pool_lock:
+            if self.parse_pool is None:
+                # Spawned, not forked: this process already runs threads and holds SQLite connections
+                self.parse_pool = ProcessPoolExecutor(max_workers=self.config["parse_processes"],
+                                                      mp_context=multiprocessing.get_context("spawn"))
+            return self.parse_pool
+
+    def iter_csv_batches(self, file_path, cursor, route, end_offset=None, width=ROW_WIDTH, controller=None):
+        # With a controller, each batch's limits follow its current (adaptive) batch size
+        max_rows = route.batch_max_rows
+        max_bytes = route.batch_max_bytes
+        if controller is not None:
+            max_rows, max_bytes = controller.batch_limits(route.batch_max_rows, route.batch_max_bytes)
+        batch = []
+        batch_bytes = 0
+        # Reading, parsing and cleaning a batch's rows are timed together as the "read" stage
+        started = time.perf_counter()
+        for row in self.iter_csv_rows(file_path, cursor, self.config["tail_mode"], end_offset, width):
+            batch.append(row)
+            # Rough size of the row as a JSON record (values, quotes and key names)
+            batch_bytes += sum(len(cell) for cell in row) + 16 * len(row)
+
+            if (max_rows and len(batch) >= max_rows) or (max_bytes and batch_bytes >= max_bytes):
+                self.metrics.observe("ingest_stage_seconds", time.perf_counter() - started, stage="read")
+                yield batch
+                batch = []
+                batch_bytes = 0
+                started = time.perf_counter()
+                if controller is not None:
+                    max_rows, max_bytes = controller.batch_limits(route.batch_max_rows, route.batch_max_bytes)
+
+        if batch:
+            self.metrics.observe("ingest_stage_seconds", time.perf_counter() - started, stage="read")
+            yield batch
+
+    def load_csv(self, file_path, route, start_offset=0):
+        # Returns (ledger state, byte offset read up to, rows sent, rows rejected, error); the
+        # state is "sent", "failed", "pending" to retry, "deferred" when the spool is full
+        # (retried once it drains) or "stopped" when the transfer was stopped (retried when it
+        # starts again); neither of the last two counts an attempt. The file is sent to each of
+        # the route's destinations in turn, and a retry sends it to all of them again.
+        error_msg = ""  # Initialize error_msg to avoid UnboundLocalError
+        state = "failed"
+        cursor = {"offset": start_offset}
+        end_offset = None
+        row_count = 0
+        rejected_count = 0
+
+        try:
+            file_name = os.path.basename(file_path)
+            schema = route.schema
+            positions = schema.bind(read_header(file_path) if schema.needs_header else None)
+            width = schema.width(positions)
+            identity = f"{os.path.abspath(file_path)}:{os.stat(file_path).st_ino}"
+
+            for destination, encoder in zip(route.destinations, route.encoders):
+                cursor = {"offset": start_offset}
+                first_pass = end_offset is None
+                row_count = 0
+                rejected_count = 0
+                skipped = 0
+
+                def payloads():
+                    # Rows are read lazily and each batch is converted and serialized just
+                    # before it is posted; the uploader stops pulling while its window is full
+                    nonlocal row_count, rejected_count, skipped
+                    batch_start = cursor["offset"]
+                    ordinal = 0  # batches read since the cursor last moved (within a parsed chunk)
+                    for batch in self.iter_csv_batches(file_path, cursor, route, end_offset, width,
+                                                       self.controllers.get(destination["url"])):
+                        if self.stop_event.is_set():
+                            raise InterruptedError("Data transfer stopped before the file was fully sent.")
+                        batch_end = cursor["offset"]
+                        ordinal = ordinal + 1 if batch_end == batch_start else 0
+                        with self.metrics.time("ingest_stage_seconds", stage="convert"):
+                            records, rejected = schema.convert(batch, positions)
+                        if first_pass:
+                            if rejected:
+                                self.log_rejected_rows(file_name, rejected, rejected_count)
+                                self.metrics.inc("ingest_rows_rejected_total", len(rejected), route=route.name)
+                            self.metrics.inc("ingest_rows_total", len(records), route=route.name)
+                            self.metrics.inc("ingest_bytes_read_total", batch_end - batch_start, route=route.name)
+                        rejected_count += len(rejected)
+                        row_count += len(records)
+                        if records:
+                            payload, content_hash = self.build_payload(records, encoder)
+                            key = self.batch_key(identity, batch_start, batch_end, ordinal, content_hash)
+                            if self.ledger.is_acked(destination["url"], key):
+                                skipped += 1  # accepted before a retry or restart
+                                self.metrics.inc("ingest_batches_total", route=route.name, result="skipped")
+                            else:
+                                self.metrics.inc("ingest_payload_bytes_total", len(payload), route=route.name)
+                                yield payload, key
+                        batch_start = batch_end
+
+                sent, spooled = self.send_data_to_api(payloads(), file_name, route, destination, encoder)
+                if skipped:
+                    self.write_to_log(f"Skipped {skipped} batch(es) of {file_name} already accepted by "
+                                      f"{destination['url']}")
+                if sent and spooled:
+                    self.write_to_log(f"Sent {sent} batch(es) from {file_name} to {destination['url']} "
+                                      f"and spooled {spooled} ({row_count} rows in all)")
+                elif sent:
+                    self.write_to_log(f"Sent {row_count} rows in {sent} batch(es) "
+                                      f"from {file_name} to {destination['url']}")
+                elif not spooled and not skipped and not self.config["tail_mode"]:
+                    raise ValueError("No valid data found in the CSV file.")
+                # In tail mode nothing complete may have been appended yet, which is not an error
+
+                # A growing file is sent to the other destinations up to the same point
+                end_offset = cursor["offset"]
+            state = "sent"
+            if rejected_count:
+                self.notify_status(f"{rejected_count} row(s) of {file_name} did not match the schema")
+                self.write_to_log(f"Rejected {rejected_count} row(s) of {file_name}", logging.WARNING)
+
+        except FileNotFoundError:
+            error_msg = f"File not found: {file_path}"
+        except SpoolFullError as se:
+            error_msg = f"API unreachable and {se}"
+            state = "deferred"
+        except InterruptedError as ie:
+            error_msg = str(ie)
+            state = "stopped"
+        except ValueError as ve:
+            error_msg = f"Value error: {ve}"
+        except requests.RequestException as re:
+            error_msg = f"Error sending data to API: {re}"
+            state = "pending"
+        except Exception as e:
+            error_msg = f"Error reading CSV file: {e}"
+        finally:
+            if error_msg:  # Only display if there's an error
+                self.notify_status(error_msg)
+                self.write_to_log(error_msg, logging.ERROR)
+
+        return state, cursor["offset"], row_count, rejected_count, error_msg or None
+
+    def log_rejected_rows(self, file_name, rejected, already_rejected):
+        limit = self.config["log_rejected_rows"] - already_rejected
+        for row, reason in rejected[:max(limit, 0)]:
+            self.write_to_log(f"Rejected row of {file_name}: {reason}: {row}", logging.WARNING)
+
+    def batch_key(self, identity, start, end, ordinal, content_hash):
+        # Deterministic: the same rows of the same file always get the same key
+        key = f"{identity}:{start}-{end}:{ordinal}:{content_hash}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def build_payload(self, records, encoder):
+        # Returns the encoded payload and a hash of its uncompressed content
+        with self.metrics.time("ingest_stage_seconds", stage="serialize"):
+            body = encoder.serialize(records)
+        if encoder.format == "json":
+            self.latest_json_data = body  # kept for the log file
+
+        sample_every = self.config["log_payload_sample_every"]
+        if (sample_every and encoder.format in ("json", "ndjson")
+                and next(self.payload_counter) % sample_every == 0):
+            self.log_payload(body)
+        with self.metrics.time("ingest_stage_seconds", stage="compress"):
+            payload = encoder.compress(body)
+        return payload, hashlib.sha256(body).hexdigest()
+
+    def send_data_to_api(self, payloads, file_name, route, destination, encoder):
+        # Returns the number of batches the API accepted and the number spooled for later
+        url = destination["url"]
+        controller = self.controllers.get(url)
+        spooled = 0
+
+        def report_response(sequence, response, key):
+            if key is not None:
+                self.ledger.record_acked(url, key)
+            self.metrics.inc("ingest_batches_total", route=route.name, result="sent")
+            self.notify_status(f"Api Response: {response.text}")
+            self.write_to_log(f"{file_name} batch {sequence + 1}: {response.text}")
+
+        def spool_batch(url, payload, headers):
+            nonlocal spooled
+            dropped = self.spool.append(url, payload, headers, route.name)
+            spooled += 1
+            self.metrics.inc("ingest_batches_total", route=route.name, result="spooled")
+            if dropped:
+                self.write_to_log(f"Spool full: dropped the {dropped} oldest spooled batch(es)", logging.ERROR)
+
+        try:
+            if self.spool is None:
+                return route.uploader.upload(url, payloads, encoder.headers,
+                                             preserve_order=route.preserve_order,
+                                             on_response=report_response, controller=controller), 0
+
+            if self.connected is False or self.spool.has_batches(url, include_retried=False):
+                # Offline, or older batches for this API are still spooled: queue behind them
+                for sequence, (payload, key) in enumerate(payloads):
+                    spool_batch(url, payload, route.uploader.batch_headers(encoder.headers, sequence, key))
+                return 0, spooled
+            batches = route.uploader.upload(url, payloads, encoder.headers,
+                                            preserve_order=route.preserve_order,
+                                            on_response=report_response,
+                                            on_unreachable=spool_batch, controller=controller)
+            return batches - spooled, spooled
+        except requests.exceptions.RequestException as e:
+            print(f"Error sending data to API: {e}")
+            raise
+        finally:
+            if spooled:
+                self.notify_status(f"API unreachable: {spooled} batch(es) of {file_name} spooled")
+                self.write_to_log(f"Spooled {spooled} batch(es) of {file_name} for {url}", logging.WARNING)
+
+    def drain_spool(self):
+        # Spooled batches are sent oldest first, at most spool_drain_rate per second. Draining
+        # pauses when the API is unreachable or throttling (429), or after a few batches in a
+        # row failed with a 5xx; a batch that fails on its own is retried later (see BatchSpool)
+        rate = self.config["spool_drain_rate"]
+        drained = 0
+        failures = 0  # batches in a row the API failed
+        while self.connected and not self.stop_event.is_set():
+            batches = self.spool.peek()
+            if not batches:
+                break
+
+            batch_id, url, payload, headers, route_name = batches[0]
+            key = headers.get(self.config["idempotency_header"] or "")
+            if key and self.ledger.is_acked(url, key):
+                self.spool.remove(batch_id)  # a copy of it was already accepted
+                continue
+            controller = self.controllers.get(url)
+            try:
+                if controller is not None:
+                    controller.bucket.acquire(self.stop_event)  # shares the destination's rate limit
+                response = self.transport.post(url, data=payload, headers=headers)
+                response.raise_for_status()
+            except InterruptedError:
+                break
+            except requests.RequestException as e:
+                response = getattr(e, "response", None)
+                status = response.status_code if response is not None else None
+                if isinstance(e, requests.ConnectionError) or status == 429:
+                    self.write_to_log(f"Spool drain paused: {e}", logging.WARNING)
+                    break
+                if status is not None and status not in api_client.HTTP_RETRY_STATUSES:
+                    self.spool_dead_letter(batch_id, url, payload, headers, f"Rejected by the API: {e}")
+                else:
+                    failures += 1
+                    attempts = self.spool.retry_later(batch_id)
+                    if attempts >= self.config["spool_max_attempts"]:
+                        self.spool_dead_letter(batch_id, url, payload, headers, f"Failed {attempts} times: {e}")
+                    else:
+                        self.write_to_log(f"Spooled batch for {url} failed ({e}), retrying it later", logging.WARNING)
+                    if failures >= spool.SPOOL_DRAIN_MAX_FAILURES:
+                        self.write_to_log(f"Spool drain paused after {failures} failed batches", logging.WARNING)
+                        break
+            else:
+                failures = 0
+                if key:
+                    self.ledger.record_acked(url, key)
+                self.spool.remove(batch_id)
+                drained += 1
+            if rate:
+                self.stop_event.wait(1 / rate)
+
+        if drained:
+            self.spool_blocked.clear()
+            left = len(self.spool)
+            self.notify_status(f"Sent {drained} spooled batch(es), {left} left")
+            self.write_to_log(f"Sent {drained} spooled batch(es), {left} left in the spool")
+
+    def spool_dead_letter(self, batch_id, url, payload, headers, reason):
+        path = self.spool.dead_letter(batch_id, url, payload, headers, reason)
+        self.spool_blocked.clear()  # it made room
+        self.notify_status(f"A spooled batch for {url} was given up on, see {path}")
+        self.write_to_log(f"Spooled batch for {url} moved to {path}: {reason}", logging.ERROR)
+
+    def prettify_json(self, json_data):
+        # Only used for the log file; payloads are always sent compact
+        try:
+            parsed_json = json.loads(json_data)
+            return json.dumps(parsed_json, indent=4, ensure_ascii=False)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            print(f"Error pretty-printing JSON: {e}")
+            return json_data if isinstance(json_data, str) else json_data.decode("utf-8", "replace")
+
+    def generate_log_file(self):
+        self.write_to_log("Log generated")
+
+        if self.latest_csv_file:
+            self.write_to_log(f"Latest CSV File: {self.latest_csv_file}")
+
+        if self.latest_json_data:
+            self.log_payload(self.latest_json_data)
+
+        self.write_to_log("=" * 50)
+
+    def log_payload(self, body):
+        # Payloads are sampled and cut short so the log never grows to the size of the data
+        if self.config["log_pretty_json"]:
+            text = self.prettify_json(body)
+        else:
+            text = body.decode("utf-8", "replace")
+        max_chars = self.config["log_payload_max_chars"]
+        if len(text) > max_chars:
+            text = f"{text[:max_chars]}... ({len(body)} bytes in total)"
+        self.write_to_log(f"JSON Data:\n{text}")
+
+    def write_to_log(self, message, level=logging.INFO, dedup=False):
+        # Non-blocking: the record is queued and written by the log listener thread.
+        # dedup marks a status message that is written at most once per log_dedup_seconds.
+        self.logger.log(level, message, extra={"dedup": dedup})
+
+    def cleanup_old_files(self, directory):
+        cutoff = time.time() - (self.config["log_retention_days"] * 24 * 60 * 60)
+
+        # Log and profile files carry their time in their names, so they are sorted by it
+        # and only the expired ones at the front are removed; other files are stat'ed
+        named = []
+        expired = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                time_range = transfer_logging.file_time_range(entry.name)
+                if time_range is not None:
+                    named.append((time_range[1], entry.name))
+                elif entry.is_file() and entry.stat().st_mtime < cutoff:
+                    expired.append(entry.name)
+        named.sort()
+        expired += [file_name for _, file_name in named[:bisect.bisect_left(named, (cutoff,))]]
+
+        for file_name in expired:
+            try:
+                os.remove(os.path.join(directory, file_name))
+                self.write_to_log(f"Deleted old log file {file_name}")
+            except Exception as e:
+                print(f"Error deleting file {file_name}: {e}")
+                self.write_to_log(f"Error deleting file {file_name}: {e}", logging.ERROR)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transfer CSV files from a directory to a REST API without the GUI.")
+    parser.add_argument("--config", help="JSON file overriding the default settings")
+    parser.add_argument("--directory", help="directory to watch (overrides source_directory)")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    if args.directory:
+        config["source_directory"] = args.directory
+    if not config["source_directory"] and not config["routes"]:
+        parser.error("no directory to watch: set routes or source_directory in the config, or pass --directory")
+
+    # Everything the GUI would show is also written to the log files
+    engine = TransferEngine(config)
+    shutdown_event = threading.Event()
+
+    def request_shutdown(signum, frame):
+        engine.write_to_log(f"Received signal {signum}, shutting down")
+        shutdown_event.set()
+
+    signal.signal(signal.SIGINT, request_shutdown)
+    signal.signal(signal.SIGTERM, request_shutdown)
+    if hasattr(signal, "SIGUSR1"):  # kill -USR1 <pid> profiles the next file
+        signal.signal(signal.SIGUSR1, lambda signum, frame: engine.profile_next_file())
+
+    engine.start()
+    try:
+        engine.run_forever(shutdown_event)
+    finally:
+        engine.stop()
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
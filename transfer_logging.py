@@ -0,0 +1,132 @@
+import os
+import re
+import queue
+import logging
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+# Records are queued and written by a background listener thread
+LOG_MAX_BYTES = 10 * 1024 * 1024    # a new log file is started each hour or at this size
+LOG_DEDUP_SECONDS = 300             # repeated status messages within this window are counted, not written
+
+# Files the engine writes to the log directory, with the time they were started in their names
+LOG_FILE_NAME = re.compile(r"latest_csv_log_(\d{4}-\d\d-\d\d_\d\d)(?:_(\d+))?\.txt")
+PROFILE_FILE_NAME = re.compile(r"profile_(\d{8}_\d{6})_.*\.prof")
+
+
+class HourlyLogFileHandler(logging.FileHandler):
+    """Writes logs/latest_csv_log_<YYYY-mm-dd_HH>.txt, moving to a new file every hour.
+
+    A file that reaches max_bytes is continued in ..._HH_1.txt, ..._HH_2.txt and so on.
+    """
+
+    def __init__(self, log_dir, max_bytes=LOG_MAX_BYTES):
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.hour = datetime.now().strftime("%Y-%m-%d_%H")
+        self.part = 0
+        super().__init__(self.build_filename(), mode="a", encoding="utf-8", delay=True)
+
+    def build_filename(self):
+        suffix = f"_{self.part}" if self.part else ""
+        return os.path.join(self.log_dir, f"latest_csv_log_{self.hour}{suffix}.txt")
+
+    def emit(self, record):
+        hour = datetime.now().strftime("%Y-%m-%d_%H")
+        if hour != self.hour:
+            self.hour = hour
+            self.part = 0
+            self.switch_file()
+
+        if self.stream is None:
+            self.stream = self._open()
+        while self.max_bytes and self.stream.tell() >= self.max_bytes:
+            self.part += 1
+            self.switch_file()
+            self.stream = self._open()
+
+        super().emit(record)
+
+    def switch_file(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self.baseFilename = os.path.abspath(self.build_filename())
+
+
+def file_time_range(file_name):
+    # (first, last) possible write time of a file named by the engine, from its name alone,
+    # or None for other files. A log file is written during the hour in its name.
+    match = LOG_FILE_NAME.fullmatch(file_name)
+    if match:
+        started = datetime.strptime(match.group(1), "%Y-%m-%d_%H").timestamp()
+        return started, started + 60 * 60
+    match = PROFILE_FILE_NAME.fullmatch(file_name)
+    if match:
+        started = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp()
+        return started, started
+    return None
+
+
+def list_log_files(log_dir):
+    # Log files, newest first, ordered by the hour and part in their names (nothing is stat'ed)
+    files = []
+    for name in os.listdir(log_dir):
+        match = LOG_FILE_NAME.fullmatch(name)
+        if match:
+            files.append((match.group(1), int(match.group(2) or 0), name))
+    return [name for _, _, name in sorted(files, reverse=True)]
+
+
+class RepeatedMessageFilter(logging.Filter):
+    """Drops a status message already logged within the last `window` seconds.
+
+    Only records logged with extra={"dedup": True} are deduplicated; everything else
+    is part of the audit trail and always written. The next time a message is let
+    through it says how many copies were dropped, so an outage logs
+    "Network Status: Disconnected" once per window instead of every 5 s.
+    """
+
+    def __init__(self, window=LOG_DEDUP_SECONDS, max_entries=1000):
+        super().__init__()
+        self.window = window
+        self.max_entries = max_entries
+        self.seen = {}  # message -> [time first logged, copies dropped since]
+
+    def filter(self, record):
+        if not getattr(record, "dedup", False):
+            return True
+        message = record.getMessage()
+        entry = self.seen.get(message)
+        if entry is not None and record.created - entry[0] < self.window:
+            entry[1] += 1
+            return False
+
+        if entry is not None and entry[1]:
+            record.msg = f"{message} (repeated {entry[1]} more times)"
+            record.args = None
+        self.seen[message] = [record.created, 0]
+
+        if len(self.seen) > self.max_entries:
+            cutoff = record.created - self.window
+            self.seen = {key: value for key, value in self.seen.items() if value[0] >= cutoff}
+        return True
+
+
+def setup_logging(log_dir, max_bytes=LOG_MAX_BYTES, dedup_seconds=LOG_DEDUP_SECONDS):
+    # Callers only put records on a queue; a single listener thread does the file I/O
+    file_handler = HourlyLogFileHandler(log_dir, max_bytes)
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S"))
+    file_handler.addFilter(RepeatedMessageFilter(dedup_seconds))
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler)
+    listener.start()
+
+    logger = logging.getLogger("data_transfer")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(QueueHandler(log_queue))
+    return logger, listener